@@ -0,0 +1,766 @@
+"""
+ASGI entry point of the trivia API.
+
+The read only routes of the categories and question lists (and the search
+on postgreSQL) are served natively on the event loop through an async
+database driver (asyncpg for postgreSQL, aiosqlite for SQLite), so a request
+waiting on the database does not hold a thread. Every other route (writes,
+imports, random questions and quizzes dealt from the decks, streamed
+responses, /metrics, errors) is handed to the flask app of create_app on a
+thread pool, so the responses, caches and change notifications stay the
+same as with the WSGI server. So are all the routes when the reads go to a
+replica or to the question store, which live in the flask app.
+
+    uvicorn --factory backend.asgi:create_asgi_app
+"""
+import io
+import re
+import sys
+import math
+import time
+import asyncio
+import weakref
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, Response
+from flask_api import status
+from werkzeug import exceptions
+from werkzeug.routing import Map, Rule
+from sqlalchemy.engine.url import make_url
+
+from backend.flaskr import create_app, QUESTIONS_PER_PAGE, encode_cursor, \
+    decode_cursor, difficulty_range, difficulty_args
+from backend.config import load_config, parse_flag
+from backend.models import Category, on_change, format_question_row
+from backend.cache import category_cache
+from backend.search import escape_like, SEARCH_RESULTS_LIMIT, \
+    TRIGRAM_EXTENSION_QUERY
+from backend.streaming import dumps
+from backend.serializer import pretty_print
+from backend.metrics import requests_total, request_duration, errors_total
+from backend.compression import compressor
+from backend.ratelimit import rate_limiter
+from backend.store import question_store
+
+try:
+    import asyncpg
+except ImportError:  # only needed for postgreSQL
+    asyncpg = None
+
+try:
+    import aiosqlite
+except ImportError:  # only needed for SQLite
+    aiosqlite = None
+
+
+QUESTION_SELECT = \
+    'SELECT id, question, answer, category, difficulty FROM questions'
+# the ASGI apps of the process, told about the changes by a single listener
+# so that an app dropped without being closed doesn't leak
+asgi_apps = weakref.WeakSet()
+
+# body chunks of a flask response waiting to be sent, the thread producing
+# them waits past that so a slow client doesn't buffer the whole stream
+STREAM_QUEUE_SIZE = 16
+
+
+class AsyncDatabase:
+    """
+    Runs the statements of the native routes. They are written with the
+    $1, $2... placeholders of asyncpg and rewritten for SQLite.
+    """
+
+    def __init__(self, config):
+        self.url = make_url(config['DATABASE_URI'])
+        self.config = config
+        self.dialect = self.url.get_backend_name()
+        self._pool = None
+        self._connection = None
+        self.trigrams = False  # pg_trgm installed, checked on connect
+
+    async def connect(self):
+        if (self.dialect == 'postgresql'):
+            if (asyncpg is None):
+                raise RuntimeError('asyncpg is required to serve postgreSQL')
+            url = make_url(str(self.url))
+            url.drivername = 'postgresql'
+            settings = {}
+            if (self.config['DB_STATEMENT_TIMEOUT']
+                    and not self.config['DB_PGBOUNCER']):
+                # PgBouncer rejects startup options, see fetch
+                settings['statement_timeout'] = \
+                    str(self.config['DB_STATEMENT_TIMEOUT'])
+            self._pool = await asyncpg.create_pool(
+                str(url), min_size=1,
+                max_size=max(1, self.config['DB_POOL_SIZE']
+                             + self.config['DB_MAX_OVERFLOW']),
+                server_settings=settings,
+                # prepared statements don't survive transaction pooling
+                statement_cache_size=0 if self.config['DB_PGBOUNCER']
+                else 100)
+            self.trigrams = bool(await self.fetchval(TRIGRAM_EXTENSION_QUERY))
+        elif (self.dialect == 'sqlite'):
+            if (aiosqlite is None):
+                raise RuntimeError('aiosqlite is required to serve SQLite')
+            self._connection = await aiosqlite.connect(self.url.database)
+        else:
+            raise RuntimeError(f'No async driver for {self.dialect}')
+
+    async def close(self):
+        if (self._pool is not None):
+            await self._pool.close()
+        if (self._connection is not None):
+            await self._connection.close()
+        self._pool = self._connection = None
+
+    async def fetch(self, sql: str, *args):
+        """ returns the rows of sql as tuples """
+        if (self._pool is not None):
+            timeout = self.config['DB_STATEMENT_TIMEOUT']
+            async with self._pool.acquire() as connection:
+                if (not timeout or not self.config['DB_PGBOUNCER']):
+                    return [tuple(row) for row in
+                            await connection.fetch(sql, *args)]
+                # same as models.set_local_timeout, the server connections
+                # are shared so the timeout lasts for the transaction only
+                async with connection.transaction():
+                    await connection.execute(
+                        f'SET LOCAL statement_timeout = {timeout}')
+                    return [tuple(row) for row in
+                            await connection.fetch(sql, *args)]
+
+        order = [int(position) - 1
+                 for position in re.findall(r'\$(\d+)', sql)]
+        return list(await self._connection.execute_fetchall(
+            re.sub(r'\$\d+', '?', sql), [args[idx] for idx in order]))
+
+    async def fetchval(self, sql: str, *args):
+        rows = await self.fetch(sql, *args)
+        return rows[0][0] if rows else None
+
+
+class ReceiveStream(io.RawIOBase):
+    """ file like body of an ASGI request, read from a worker thread """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while (not self._buffer and not self._done):
+            message = asyncio.run_coroutine_threadsafe(
+                self._receive(), self._loop).result()
+            self._buffer = message.get('body', b'')
+            self._done = not message.get('more_body', False)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def where(conditions):
+    return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+def difficulty_condition(difficulties, params):
+    """ appends the (min, max) difficulties to params, returns the SQL """
+    params.extend(difficulties)
+    return f'difficulty BETWEEN ${len(params) - 1} AND ${len(params)}'
+
+
+def parse_modified(value):
+    # SQLite hands back the DateTime columns as text
+    if (isinstance(value, str)):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class TriviaASGI:
+    """ ASGI application serving the routes of the flask app """
+
+    routes = Map([
+        Rule('/api/v1.0/categories', methods=['GET'],
+             endpoint='get_categories'),
+        Rule('/api/v1.0/categories/<int:categoryId>', methods=['GET'],
+             endpoint='get_category'),
+        Rule('/api/v1.0/categories/<int:categoryId>/questions',
+             methods=['GET'], endpoint='get_questions_by_category2'),
+        Rule('/api/v1.0/questions', methods=['GET'],
+             endpoint='get_questions'),
+        Rule('/api/v1.0/questions/category', methods=['GET'],
+             endpoint='get_questions_by_category'),
+        Rule('/api/v1.0/questions/search', methods=['POST'],
+             endpoint='find_questions'),
+    ])
+
+    # tables each native GET route depends on (see backend.conditional)
+    conditional = {
+        'get_categories': ('categories',),
+        'get_category': ('categories',),
+        'get_questions_by_category2': ('questions', 'categories'),
+        'get_questions': ('questions', 'categories'),
+        'get_questions_by_category': ('questions', 'categories'),
+    }
+
+    def __init__(self, app, config):
+        self.app = app
+        self.db = AsyncDatabase(config)
+        # as many threads as the flask app has connections
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, config['DB_POOL_SIZE']
+                            + config['DB_MAX_OVERFLOW']))
+        self._connected = None
+        # (list of formatted categories, dictionary of categories by id)
+        self._categories = None
+        self._expires = 0.0
+        self._categoriesVersion = None
+        asgi_apps.add(self)
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] == 'lifespan'):
+            return await self.lifespan(receive, send)
+        if (scope['type'] != 'http'):
+            raise RuntimeError(f'Unsupported scope {scope["type"]}')
+
+        environ = self.environ(scope)
+        try:
+            rule, arguments = self.routes.bind_to_environ(environ) \
+                .match(return_rule=True)
+        except exceptions.HTTPException:
+            rule = None
+
+        request = Request(environ)
+        if (not self.native(rule, request)):
+            # the body is read by the view as it needs it
+            environ['wsgi.input'] = io.BufferedReader(
+                ReceiveStream(receive, asyncio.get_running_loop()))
+            return await self.call_flask(environ, send)
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if (not message.get('more_body', False)):
+                break
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+
+        start = time.perf_counter()
+        response = await self.dispatch(rule.endpoint, request, arguments)
+        origin = request.headers.get('Origin')
+        response.headers['Access-Control-Allow-Origin'] = origin or '*'
+        if (origin):
+            response.vary.add('Origin')
+        response.headers.add('Access-Control-Allow-Headers',
+                             'Content-Type,Authorization,true')
+        response.headers.add('Access-Control-Allow-Methods',
+                             'GET,PATCH,POST,DELETE,OPTIONS')
+        compressor.apply(response, request)
+        requests_total.inc(rule.rule, request.method,
+                           str(response.status_code))
+        request_duration.observe(
+            time.perf_counter() - start, rule.rule, request.method)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in response.headers.to_wsgi_list()]
+        })
+        await send({'type': 'http.response.body',
+                    'body': response.get_data()})
+
+    def native(self, rule, request):
+        """ true if the request is served on the event loop """
+        if (rule is None):
+            return False  # flask answers with its error envelopes
+        if (question_store.enabled
+                or self.app.extensions.get('replica') is not None):
+            return False  # read from memory or from the replica by flask
+        if (rule.endpoint == 'find_questions'
+                and self.db.dialect != 'postgresql'):
+            return False  # the in process search index lives in flask
+        # streamed responses are produced by the flask views
+        return not request.args.get(
+            'stream', False, type=parse_flag)  # type: ignore
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if (message['type'] == 'lifespan.startup'):
+                try:
+                    await self.connected()
+                except Exception as err:
+                    print(sys.exc_info(), err)
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': str(err)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif (message['type'] == 'lifespan.shutdown'):
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def connected(self):
+        """ connects the database on first use """
+        if (self._connected is None):
+            self._connected = asyncio.ensure_future(self.db.connect())
+        try:
+            await asyncio.shield(self._connected)
+        except Exception:
+            self._connected = None
+            raise
+
+    async def close(self):
+        await self.db.close()
+        self._connected = None
+        self.executor.shutdown(wait=False)
+
+    """
+    WSGI bridge
+        runs the flask app on the thread pool and forwards its body chunks
+        as they are produced, so the streamed responses stay streamed
+    """
+
+    def environ(self, scope):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '')
+            .encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(),
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if (name in ('CONTENT_TYPE', 'CONTENT_LENGTH')):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' \
+                if key in environ else value
+        return environ
+
+    async def call_flask(self, environ, send):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        started = []
+        closed = []  # not empty once the client is gone
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), headers]
+
+        async def put(chunk):
+            if (not closed):
+                await queue.put(chunk)
+
+        def run():
+            try:
+                result = self.app(environ, start_response)
+                try:
+                    for chunk in result:
+                        if (closed):
+                            break
+                        if (chunk):
+                            # waits for room in the queue
+                            asyncio.run_coroutine_threadsafe(
+                                put(chunk), loop).result()
+                finally:
+                    if (hasattr(result, 'close')):
+                        result.close()
+            finally:
+                asyncio.run_coroutine_threadsafe(put(None), loop).result()
+
+        future = loop.run_in_executor(self.executor, run)
+        headersSent = False
+        try:
+            while True:
+                chunk = await queue.get()
+                if (chunk is None):
+                    break
+                if (not headersSent):
+                    await self.send_start(send, *started)
+                    headersSent = True
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+        except BaseException:
+            # frees a thread waiting for room, it stops at the next chunk
+            closed.append(True)
+            while (not queue.empty()):
+                queue.get_nowait()
+            raise
+        await future
+        if (not headersSent):
+            await self.send_start(send, *started)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send_start(self, send, statusCode, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': statusCode,
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in headers]
+        })
+
+    """
+    Native routes
+        same validations, envelopes and ETags as the views of create_app
+    """
+
+    async def dispatch(self, endpoint, request, arguments):
+        try:
+            await self.connected()
+            retryAfter = rate_limiter.check(
+                rate_limiter.routes.get(endpoint), request)
+            if (retryAfter is not None):
+                return self.too_many_requests(retryAfter)
+
+            tables = self.conditional.get(endpoint)
+            if (tables is None):
+                return await getattr(self, endpoint)(request, **arguments)
+
+            etag, modified, versions = await self.versions(tables)
+            categoriesVersion = versions.get(Category.__tablename__)
+            if (categoriesVersion is not None
+                    and categoriesVersion != self._categoriesVersion):
+                # changed by another process, reloaded by the route
+                self._categories = None
+                self._categoriesVersion = categoriesVersion
+            if (request.if_none_match):
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                fresh = modified is not None \
+                    and request.if_modified_since is not None \
+                    and modified <= request.if_modified_since
+
+            if (fresh):
+                response = Response(status=304)
+            else:
+                response = await getattr(self, endpoint)(request, **arguments)
+                if (response.status_code != 200):
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if (modified is not None):
+                response.last_modified = modified
+            return response
+
+        except exceptions.BadRequest as err:
+            return self.error(err.code, str(err), 'Bad request')
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return self.internal_error(err)
+
+    async def versions(self, tables):
+        """
+        returns the ETag, last modified date and version by name of tables
+        """
+        placeholders = ', '.join(f'${idx + 1}' for idx in range(len(tables)))
+        rows = await self.db.fetch(
+            'SELECT name, version, modified FROM table_versions '
+            f'WHERE name IN ({placeholders})', *tables)
+        versions = {name: 0 for name in tables}
+        modified = None
+        for name, version, changed in rows:
+            versions[name] = version
+            changed = parse_modified(changed)
+            modified = changed if modified is None else max(modified, changed)
+        etag = '-'.join(f'{name}.{version}'
+                        for name, version in versions.items())
+        if (modified is not None):
+            modified = modified.replace(microsecond=0, tzinfo=None)
+        return etag, modified, versions
+
+    async def categories(self):
+        if (self._categories is None or time.monotonic() >= self._expires):
+            data = [{'id': categoryId, 'type': categoryType}
+                    for categoryId, categoryType in await self.db.fetch(
+                        'SELECT id, type FROM categories ORDER BY id ASC')]
+            self._categories = (data, {datum['id']: datum for datum in data})
+            self._expires = time.monotonic() + category_cache.ttl
+        return self._categories
+
+    async def category(self, categoryId):
+        """ returns the formatted category or None if it does not exist """
+        index = (await self.categories())[1]
+        try:
+            return index.get(int(categoryId))
+        except (TypeError, ValueError):
+            return None
+
+    def invalidate_categories(self, table, operation, records):
+        if (table == Category.__tablename__):
+            self._categories = None
+
+    async def get_categories(self, request):
+        return self.jsonify({
+            'success': True,
+            'data': (await self.categories())[0]
+        })
+
+    async def get_category(self, request, categoryId):
+        category = await self.category(categoryId)
+        if (category is None):
+            return self.unprocessable("Category does not exist")
+
+        return self.jsonify({
+            'success': True,
+            'data': category
+        })
+
+    async def get_questions_by_category2(self, request, categoryId):
+        try:
+            difficulties = difficulty_args(request.args)
+        except ValueError as err:
+            return self.unprocessable(str(err))
+
+        category = await self.category(categoryId)
+        if (category is None):
+            return self.unprocessable("Category does not exist")
+
+        return await self.category_questions(category, difficulties)
+
+    async def get_questions_by_category(self, request):
+        categoryId = request.args.get('id', None, type=int)  # type: ignore
+        categoryType = request.args.get(
+            'type', None, type=str)  # type: ignore
+        try:
+            difficulties = difficulty_args(request.args)
+        except ValueError as err:
+            return self.unprocessable(str(err))
+
+        if (categoryId is None and categoryType is None):
+            return self.unprocessable(
+                "Bad category arguments. Either Id or type are required")
+
+        if (categoryId is not None and categoryType is not None):
+            return self.unprocessable(
+                "Bad category arguments. Submit either category Id or type")
+
+        if (categoryType is None):
+            category = await self.category(categoryId)
+        else:
+            needle = categoryType.lower()
+            category = next(
+                (datum for datum in (await self.categories())[0]
+                 if needle in (datum['type'] or '').lower()), None)
+        if (category is None):
+            return self.unprocessable("Category does not exist")
+
+        return await self.category_questions(category, difficulties)
+
+    async def category_questions(self, category, difficulties):
+        params = [category['id']]
+        conditions = ['category = $1']
+        if (difficulties is not None):
+            conditions.append(difficulty_condition(difficulties, params))
+        rows = await self.db.fetch(
+            f'{QUESTION_SELECT}{where(conditions)} ORDER BY id ASC', *params)
+
+        return self.jsonify({
+            'success': True,
+            'category': category,
+            'data': [format_question_row(datum) for datum in rows]
+        })
+
+    async def get_questions(self, request):
+        pageNumber = request.args.get('page', 1, type=int)  # type: ignore
+        itemsPerPage = request.args.get(
+            'perPage', QUESTIONS_PER_PAGE, type=int)  # type: ignore
+        categoryId = request.args.get(
+            'category', None, type=int)  # type: ignore
+        cursor = request.args.get('cursor', None, type=str)  # type: ignore
+        afterId = request.args.get('after_id', None, type=int)  # type: ignore
+        withTotal = request.args.get(
+            'withTotal', False, type=parse_flag)  # type: ignore
+        try:
+            difficulties = difficulty_args(request.args)
+        except ValueError as err:
+            return self.unprocessable(str(err))
+
+        conditions = []
+        params = []
+        if (difficulties is not None):
+            conditions.append(difficulty_condition(difficulties, params))
+        if (categoryId is not None):
+            categoryObj = await self.category(categoryId)
+            if (categoryObj is None):
+                return self.unprocessable(
+                    "Database error. Category not found.")
+            params.append(categoryId)
+            conditions.append(f'category = ${len(params)}')
+        else:
+            categoryObj = None
+
+        if (cursor is not None or afterId is not None):
+            if (cursor is not None):
+                afterId = decode_cursor(cursor)
+                if (afterId is None):
+                    return self.unprocessable("Invalid cursor")
+            if (itemsPerPage < 1):
+                return self.unprocessable("perPage must be greater than 0")
+
+            rows = await self.db.fetch(
+                f'{QUESTION_SELECT}'
+                f'{where(conditions + [f"id > ${len(params) + 1}"])} '
+                f'ORDER BY id ASC LIMIT ${len(params) + 2}',
+                *params, afterId, itemsPerPage + 1)
+            items = rows[:itemsPerPage]
+            nextCursor = encode_cursor(items[-1][0]) \
+                if len(rows) > itemsPerPage else None
+            total = await self.count_questions(
+                categoryId, difficulties, conditions, params) \
+                if withTotal else None
+
+            return self.jsonify({
+                'success': True,
+                'data': [format_question_row(datum) for datum in items],
+                'total': total,
+                'category': categoryObj,
+                'categories': (await self.categories())[0],
+                'cursor': nextCursor,
+                'perPage': itemsPerPage
+            })
+
+        # same bounds as flask_sqlalchemy's paginate
+        if (pageNumber < 1 or itemsPerPage < 0):
+            return self.not_found("Database error. Page outside limits.")
+        rows = await self.db.fetch(
+            f'{QUESTION_SELECT}{where(conditions)} ORDER BY id ASC '
+            f'LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}',
+            *params, itemsPerPage, (pageNumber - 1) * itemsPerPage)
+        if (not rows and pageNumber != 1):
+            return self.not_found("Database error. Page outside limits.")
+        total = await self.count_questions(
+            categoryId, difficulties, conditions, params)
+
+        return self.jsonify({
+            'success': True,
+            'data': [format_question_row(datum) for datum in rows],
+            'total': total,
+            'category': categoryObj,
+            'categories': (await self.categories())[0],
+            'page': pageNumber,
+            'pages': math.ceil(total / itemsPerPage) if itemsPerPage else 0,
+            'perPage': itemsPerPage
+        })
+
+    async def find_questions(self, request):
+        body = request.get_json()  # type: ignore
+        if (body is None):
+            return self.unprocessable('No search string provided')
+
+        search = body.get('search', None)
+        if (search is None):
+            return self.unprocessable('No search string provided')
+
+        limit = body.get('limit', SEARCH_RESULTS_LIMIT)
+        if (not isinstance(limit, int) or limit < 1):
+            return self.unprocessable('Invalid limit')
+        try:
+            difficulties = difficulty_range(body.get('minDifficulty', None),
+                                            body.get('maxDifficulty', None))
+        except ValueError as err:
+            return self.unprocessable(str(err))
+
+        search = search.strip()
+        rows = []
+        if (search != ''):
+            params = [f'%{escape_like(search)}%']
+            conditions = ["question ILIKE $1 ESCAPE '\\'"]
+            order = 'id ASC'
+            if (self.db.trigrams):
+                params.append(search)
+                order = f'similarity(question, ${len(params)}) DESC, {order}'
+            if (difficulties is not None):
+                conditions.append(difficulty_condition(difficulties, params))
+            params.append(limit)
+            rows = await self.db.fetch(
+                f'{QUESTION_SELECT}{where(conditions)} '
+                f'ORDER BY {order} LIMIT ${len(params)}', *params)
+
+        formattedData = [format_question_row(datum) for datum in rows]
+        return self.jsonify({
+            'success': True,
+            'query': search,
+            'data': formattedData,
+            'found': len(formattedData)
+        })
+
+    async def count_questions(self, categoryId, difficulties, conditions,
+                              params):
+        """ reads the counters unless filtered on the difficulty """
+        if (difficulties is not None):
+            return await self.db.fetchval(
+                f'SELECT count(*) FROM questions{where(conditions)}', *params)
+        if (categoryId is None):
+            return await self.db.fetchval(
+                'SELECT COALESCE(sum(questions), 0) FROM category_counts')
+        return await self.db.fetchval(
+            'SELECT COALESCE(sum(questions), 0) FROM category_counts '
+            'WHERE category = $1', categoryId)
+
+    def jsonify(self, data, statusCode=status.HTTP_200_OK):
+        # same bytes as flask's jsonify
+        return Response(dumps(data, pretty_print(self.app)) + '\n',
+                        status=statusCode, mimetype='application/json')
+
+    def error(self, statusCode, error, message):
+        return self.jsonify({
+            'success': False,
+            'error': error,
+            'message': message
+        }, statusCode)
+
+    def not_found(self, error):
+        errors_total.inc('not_found')
+        return self.error(status.HTTP_404_NOT_FOUND, str(error), 'Not found')
+
+    def unprocessable(self, error):
+        errors_total.inc('unprocessable')
+        return self.error(422, error, 'Unprocessable entity')
+
+    def too_many_requests(self, retryAfter: int):
+        errors_total.inc('too_many_requests')
+        response = self.error(status.HTTP_429_TOO_MANY_REQUESTS,
+                              str(exceptions.TooManyRequests()),
+                              'Too many requests')
+        response.headers['Retry-After'] = str(retryAfter)
+        return response
+
+    def internal_error(self, error: Exception):
+        errors_total.inc('internal_error')
+        return self.error(status.HTTP_500_INTERNAL_SERVER_ERROR,
+                          error.args[0], 'Internal Server Error')
+
+
+@on_change
+def invalidate_asgi_categories(table, operation, records):
+    for app in list(asgi_apps):
+        app.invalidate_categories(table, operation, records)
+
+
+def create_asgi_app(env_config=".env"):
+    """ returns the ASGI application of the flask app of create_app """
+    return TriviaASGI(create_app(env_config), load_config(env_config))
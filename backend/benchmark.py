@@ -0,0 +1,353 @@
+"""
+Load testing benchmark for the trivia API.
+
+Seeds a synthetic dataset, drives every route registered by create_app with
+a configurable number of concurrent clients and prints the latency
+percentiles and throughput of each route as json, so runs can be compared.
+
+    python -m backend.benchmark --questions 50000 --concurrency 8 \\
+        --requests 500 --output results.json
+
+By default the requests go through the flask test client (no network). Pass
+--url to drive a running server instead; it must use the same database as
+the environment file passed in --env.
+"""
+import math
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from faker import Faker
+from backend.flaskr import create_app, MAX_DIFFICULTY
+from backend.models import db, Question, Category, notify_change
+from backend.bulk import mutate_questions
+
+
+SEED_CHUNK_SIZE = 5000
+BENCHMARK_CATEGORY = 'benchmark'
+
+
+def seed(questions: int, categories: int, rng: random.Random):
+    """ inserts the synthetic categories and questions, returns their ids """
+    fake = Faker()
+    fake.seed_instance(rng.random())
+
+    records = [Category(type=f'{BENCHMARK_CATEGORY} {idx}')
+               for idx in range(categories)]
+    db.session.add_all(records)
+    db.session.commit()
+    categoryIds = [record.id for record in records]
+
+    for start in range(0, questions, SEED_CHUNK_SIZE):
+        db.session.bulk_insert_mappings(Question, [{
+            'question': fake.sentence(nb_words=10).rstrip('.') + '?',
+            'answer': fake.word(),
+            'category': rng.choice(categoryIds),
+            'difficulty': rng.randint(1, MAX_DIFFICULTY)
+        } for idx in range(start, min(start + SEED_CHUNK_SIZE, questions))])
+        db.session.commit()
+    notify_change(Question.__tablename__, 'reset')
+
+    return categoryIds
+
+
+def clean(categoryIds):
+    """ removes the benchmark categories and their questions """
+    for categoryId in categoryIds:
+        mutate_questions('delete', filters={'category': categoryId})
+    for record in Category.query.filter(Category.id.in_(categoryIds)):
+        db.session.delete(record)
+    db.session.commit()
+
+
+class Context:
+    """ state shared by the scenarios of a run """
+
+    def __init__(self, categoryIds, questionIds, rng: random.Random):
+        self.categoryIds = categoryIds
+        self.questionIds = questionIds
+        self.created = deque()
+        self.quizzes = deque()
+        self._rng = rng
+        self._lock = threading.Lock()
+
+    def choice(self, values):
+        with self._lock:
+            return self._rng.choice(values)
+
+    def sample(self, values, count):
+        with self._lock:
+            return self._rng.sample(values, min(count, len(values)))
+
+    def quiz(self):
+        return self.choice(self.quizzes) if self.quizzes else 'none'
+
+    def word(self):
+        return self.choice(['the', 'what', 'who', 'which', 'where', 'year'])
+
+    def new_question(self, tag='created'):
+        return {
+            'question': f'{BENCHMARK_CATEGORY} {tag} question',
+            'answer': 'answer',
+            'category': self.choice(self.categoryIds),
+            'difficulty': self.choice(range(1, MAX_DIFFICULTY + 1))
+        }
+
+
+def delete_created(ctx: Context):
+    try:
+        questionId = ctx.created.popleft()
+    except IndexError:
+        questionId = 0  # nothing left to delete, measures a 404 instead
+    return 'DELETE', f'/api/v1.0/questions/{questionId}', None
+
+
+def delete_quiz(ctx: Context):
+    try:
+        quizId = ctx.quizzes.popleft()
+    except IndexError:
+        quizId = 'none'
+    return 'DELETE', f'/api/v1.0/quizzes/{quizId}', None
+
+
+"""
+Scenarios
+    (rule, method) of every route mapped to a function returning the
+    (method, url, json body) of a request. The writes are ordered so that
+    the questions (and quizzes) created by the POST are the ones deleted
+    afterwards.
+"""
+
+SCENARIOS = {
+    ('/api/v1.0/categories', 'GET'): lambda ctx: (
+        'GET', '/api/v1.0/categories', None),
+    ('/api/v1.0/cache', 'GET'): lambda ctx: (
+        'GET', '/api/v1.0/cache', None),
+    ('/metrics', 'GET'): lambda ctx: ('GET', '/metrics', None),
+    ('/api/v1.0/categories/<int:categoryId>', 'GET'): lambda ctx: (
+        'GET', f'/api/v1.0/categories/{ctx.choice(ctx.categoryIds)}', None),
+    ('/api/v1.0/categories/<int:categoryId>/questions', 'GET'): lambda ctx: (
+        'GET',
+        f'/api/v1.0/categories/{ctx.choice(ctx.categoryIds)}/questions',
+        None),
+    ('/api/v1.0/questions', 'GET'): lambda ctx: (
+        'GET', f'/api/v1.0/questions?page={ctx.choice(range(1, 50))}', None),
+    ('/api/v1.0/dashboard', 'GET'): lambda ctx: (
+        'GET', f'/api/v1.0/dashboard?page={ctx.choice(range(1, 50))}', None),
+    ('/api/v1.0/questions/category', 'GET'): lambda ctx: (
+        'GET',
+        f'/api/v1.0/questions/category?id={ctx.choice(ctx.categoryIds)}',
+        None),
+    ('/api/v1.0/questions/search', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/questions/search', {'search': ctx.word()}),
+    ('/api/v1.0/questions/random', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/questions/random', {
+            'category': ctx.choice(ctx.categoryIds),
+            'previous': ctx.sample(ctx.questionIds, 10)
+        }),
+    ('/api/v1.0/questions', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/questions', ctx.new_question()),
+    ('/api/v1.0/questions/<int:question_id>', 'DELETE'): delete_created,
+    ('/api/v1.0/questions/batch', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/questions/batch', {
+            'action': 'update',
+            'ids': ctx.sample(ctx.questionIds, 20),
+            'values': {'difficulty': ctx.choice(range(1, MAX_DIFFICULTY + 1))}
+        }),
+    ('/api/v1.0/quizzes', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/quizzes', {
+            'category': ctx.choice(ctx.categoryIds),
+            'adaptive': ctx.choice([True, False])}),
+    ('/api/v1.0/quizzes/<string:quizId>', 'GET'): lambda ctx: (
+        'GET', f'/api/v1.0/quizzes/{ctx.quiz()}', None),
+    ('/api/v1.0/quizzes/<string:quizId>/next', 'POST'): lambda ctx: (
+        'POST', f'/api/v1.0/quizzes/{ctx.quiz()}/next', {
+            'correct': ctx.choice([True, False])}),
+    ('/api/v1.0/quizzes/<string:quizId>', 'DELETE'): delete_quiz,
+    ('/api/v1.0/questions/import', 'POST'): lambda ctx: (
+        'POST', '/api/v1.0/questions/import', [
+            ctx.new_question('imported') for idx in range(10)]),
+}
+
+
+def routes(app):
+    """ returns the (rule, method) of every route of the app """
+    return sorted((rule.rule, method)
+                  for rule in app.url_map.iter_rules()
+                  if rule.endpoint != 'static'
+                  for method in rule.methods - {'HEAD', 'OPTIONS'})
+
+
+class Client:
+    """ sends the requests through the test client or over http """
+
+    def __init__(self, app, url=None, acceptEncoding=None):
+        self.url = url.rstrip('/') if url else None
+        self.headers = {'Accept-Encoding': acceptEncoding} \
+            if acceptEncoding else {}
+        self._app = app
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        if (isinstance(body, list)):  # json lines
+            data = '\n'.join(json.dumps(line) for line in body).encode()
+            contentType = 'application/x-ndjson'
+        else:
+            data = json.dumps(body).encode() if body is not None else None
+            contentType = 'application/json'
+
+        if (self.url is None):
+            if (not hasattr(self._local, 'client')):
+                self._local.client = self._app.test_client()
+            response = self._local.client.open(
+                path, method=method, data=data, content_type=contentType,
+                headers=self.headers)
+            return response.status_code, response.get_data()
+
+        request = urllib.request.Request(
+            self.url + path, data=data, method=method,
+            headers={'Content-Type': contentType, **self.headers})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.read()
+
+
+def percentile(values, rank):
+    """ nearest rank percentile of the sorted values """
+    if (not values):
+        return None
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+def measure(client: Client, scenario, ctx: Context, requests, concurrency,
+            remember=None):
+    """ sends requests from concurrency threads and returns the stats """
+    latencies = []
+    sizes = []
+    errors = 0
+    lock = threading.Lock()
+
+    def call(idx):
+        nonlocal errors
+        method, path, body = scenario(ctx)
+        start = time.perf_counter()
+        status, content = client.send(method, path, body)
+        elapsed = time.perf_counter() - start
+        if (remember is not None and status == 200):
+            remember.append(json.loads(content)['data']['id'])
+        with lock:
+            latencies.append(elapsed)
+            sizes.append(len(content))
+            if (status >= 400):
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / duration, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'mean_bytes': round(sum(sizes) / len(sizes))
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    app = create_app(args.env)
+    client = Client(app, args.url, args.accept_encoding)
+
+    with app.app_context():
+        started = time.perf_counter()
+        categoryIds = seed(args.questions, args.categories, rng)
+        seeded = time.perf_counter() - started
+        questionIds = [questionId for (questionId,) in db.session.query(
+            Question.id).filter(Question.category.in_(categoryIds))]
+        database = db.engine.dialect.name
+
+    ctx = Context(categoryIds, questionIds, rng)
+    results = {}
+    uncovered = []
+    try:
+        for route in sorted(routes(app), key=lambda route: (
+                route[1] == 'DELETE', route)):
+            scenario = SCENARIOS.get(route)
+            if (scenario is None):
+                uncovered.append(' '.join(reversed(route)))
+                continue
+            if (args.routes and route[0] not in args.routes):
+                continue
+            results[' '.join(reversed(route))] = measure(
+                client, scenario, ctx, args.requests, args.concurrency,
+                remember={
+                    ('/api/v1.0/questions', 'POST'): ctx.created,
+                    ('/api/v1.0/quizzes', 'POST'): ctx.quizzes
+                }.get(route))
+    finally:
+        if (not args.keep):
+            with app.app_context():
+                clean(categoryIds)
+
+    return {
+        'config': {
+            'questions': args.questions,
+            'categories': args.categories,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'target': args.url or 'test client',
+            'database': database,
+            'seed': args.seed,
+            'accept_encoding': args.accept_encoding
+        },
+        'seed_seconds': round(seeded, 3),
+        'routes': results,
+        'uncovered': uncovered
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--env', default='.env',
+                        help='environment file with the DATABASE_URI')
+    parser.add_argument('--url', default=None,
+                        help='base url of a running server')
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='number of requests per route')
+    parser.add_argument('--routes', nargs='*', default=None,
+                        help='only benchmark these rules')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--accept-encoding', default=None,
+                        help='Accept-Encoding header sent, e.g. gzip')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the seeded data')
+    parser.add_argument('--output', default=None,
+                        help='file to write the json results to')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(run(args), indent=2)
+    if (args.output):
+        with open(args.output, 'w') as file:
+            file.write(report)
+    print(report)
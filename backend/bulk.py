@@ -0,0 +1,287 @@
+import io
+import sys
+import csv
+import json
+
+from sqlalchemy import select, and_
+from backend.models import db, Question, bump_versions, notify_change
+
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+IMPORT_FORMATS = ('jsonl', 'csv')
+BATCH_ACTIONS = ('delete', 'update')
+BATCH_FIELDS = ('category', 'difficulty')
+QUESTION_FIELDS = ('question', 'answer', 'category', 'difficulty')
+
+
+class LineDecoder:
+    """
+    Iterates the lines of a text or utf-8 bytes source. The lines that can't
+    be decoded are returned with replacement characters and their number and
+    error are kept in invalid. number is the count of lines read so far.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.number = 0
+        self.invalid = {}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.lines)
+        self.number += 1
+        if (isinstance(line, bytes)):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError as err:
+                self.invalid[self.number] = f'Invalid utf-8 [{err.reason}]'
+                line = line.decode('utf-8', errors='replace')
+        return line
+
+
+def parse_rows(lines, format='jsonl'):
+    """
+    yields (line number, row dictionary or None, error message or None) for
+    every non empty line of a JSON Lines or CSV (with a header) source.
+    Lines that are not utf-8 or not valid csv are reported as errors.
+    """
+    lines = LineDecoder(lines)
+
+    if (format == 'csv'):
+        reader = csv.DictReader(lines)
+        lastLine = 0
+        while (True):
+            try:
+                row = next(reader)
+                error = None
+            except StopIteration:
+                return
+            except csv.Error as err:
+                row, error = None, f'Invalid csv [{err}]'
+            # a quoted field can span several lines
+            for number in range(lastLine + 1, lines.number + 1):
+                if (error is None and number in lines.invalid):
+                    row, error = None, lines.invalid[number]
+            lastLine = lines.number
+            yield lines.number, row, error
+
+    for line in lines:
+        if (lines.number in lines.invalid):
+            yield lines.number, None, lines.invalid[lines.number]
+            continue
+        if (not line.strip()):
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield lines.number, None, f'Invalid json [{err}]'
+            continue
+        if (not isinstance(row, dict)):
+            yield lines.number, None, 'Invalid json [expected an object]'
+            continue
+        yield lines.number, row, None
+
+
+def parse_integer(value):
+    """
+    returns the integer of a number or numeric string, None for booleans,
+    fractions and anything else
+    """
+    if (isinstance(value, bool)):
+        return None
+    if (isinstance(value, float)):
+        return int(value) if value.is_integer() else None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_row(row: dict, categories, maxDifficulty: int):
+    """
+    applies the same rules as POST /api/v1.0/questions and returns
+    (mapping, None) or (None, error message)
+    """
+    category = parse_integer(row.get('category'))
+    if (category not in categories):
+        return None, 'Invalid data [category not found]'
+
+    difficulty = parse_integer(row.get('difficulty')) or 0
+    if (difficulty < 1 or difficulty > maxDifficulty):
+        return None, \
+            f'Invalid data [difficulty must be between 1 and {maxDifficulty}]'
+
+    question = str(row.get('question') or '').strip()
+    answer = str(row.get('answer') or '').strip()
+    if (question == '' or answer == ''):
+        return None, 'Invalid data [question or answer]'
+
+    return {
+        'question': question,
+        'answer': answer,
+        'category': category,
+        'difficulty': difficulty
+    }, None
+
+
+def validate_fields(fields: dict, categories, maxDifficulty: int):
+    """
+    applies the rules of validate_row to the category and difficulty of a
+    batch filter or values and returns (mapping, None) or (None, error message)
+    """
+    mapping = {}
+    if ('category' in fields):
+        mapping['category'] = parse_integer(fields['category'])
+        if (mapping['category'] not in categories):
+            return None, 'Invalid data [category not found]'
+
+    if ('difficulty' in fields):
+        difficulty = parse_integer(fields['difficulty']) or 0
+        if (difficulty < 1 or difficulty > maxDifficulty):
+            return None, \
+                'Invalid data ' \
+                f'[difficulty must be between 1 and {maxDifficulty}]'
+        mapping['difficulty'] = difficulty
+
+    return mapping, None
+
+
+def copy_questions(mappings):
+    # COPY is the fastest way to load rows into postgreSQL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for mapping in mappings:
+        writer.writerow([mapping[field] for field in QUESTION_FIELDS])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f'COPY {Question.__tablename__} ({", ".join(QUESTION_FIELDS)}) '
+        'FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def insert_chunk(chunk):
+    """ inserts the mappings in a single transaction """
+    mappings = [mapping for number, mapping in chunk]
+    if (db.engine.dialect.name == 'postgresql'):
+        copy_questions(mappings)
+    else:
+        db.session.bulk_insert_mappings(Question, mappings)
+    bump_versions(db.session.connection(), [Question.__tablename__])
+    db.session.commit()
+
+
+def import_questions(lines, categories, maxDifficulty: int,
+                     format='jsonl', chunkSize=IMPORT_CHUNK_SIZE):
+    """
+    validates and inserts the questions read from lines in chunks of
+    chunkSize rows. Invalid rows, or chunks the database rejects, are reported
+    without aborting the rest of the import.
+    """
+    inserted = 0
+    failed = 0
+    errors = []
+
+    def fail(number, error):
+        nonlocal failed
+        failed += 1
+        if (len(errors) < IMPORT_MAX_ERRORS):
+            errors.append({'line': number, 'error': error})
+
+    def flush(chunk):
+        nonlocal inserted
+        try:
+            insert_chunk(chunk)
+            inserted += len(chunk)
+        except Exception as err:
+            print(sys.exc_info(), err)
+            db.session.rollback()
+            for number, mapping in chunk:
+                fail(number, f'Database error [{err.args[0]}]')
+
+    chunk = []
+    number = 0
+    try:
+        try:
+            for number, row, error in parse_rows(lines, format):
+                if (error is None):
+                    mapping, error = validate_row(
+                        row, categories, maxDifficulty)
+                if (error is not None):
+                    fail(number, error)
+                    continue
+
+                chunk.append((number, mapping))
+                if (len(chunk) >= chunkSize):
+                    flush(chunk)
+                    chunk = []
+        except Exception as err:
+            # a source that can't be read any further ends the import, the
+            # rows read so far are still inserted and reported
+            print(sys.exc_info(), err)
+            fail(number + 1, f'Unreadable source [{err}]')
+
+        if (chunk):
+            flush(chunk)
+    finally:
+        if (inserted):
+            # the bulk inserts bypass the session events
+            notify_change(Question.__tablename__, 'reset')
+
+    return {
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors
+    }
+
+
+def mutate_questions(action: str, ids=None, filters=None, values=None):
+    """
+    deletes, or updates with values, the questions matching the ids and the
+    filters with a single statement and transaction.
+    Returns the number of questions affected and the requested ids that were
+    not found.
+    """
+    table = Question.__table__
+    clauses = []
+    if (ids is not None):
+        clauses.append(table.c.id.in_(ids))
+    for field, value in (filters or {}).items():
+        clauses.append(table.c[field] == value)
+    condition = and_(*clauses)
+
+    if (action == 'delete'):
+        statement = table.delete().where(condition)
+    else:
+        statement = table.update().where(condition).values(**values)
+
+    try:
+        if (db.engine.dialect.name == 'postgresql'):
+            result = db.session.execute(statement.returning(table.c.id))
+            affected = [questionId for (questionId,) in result]
+        else:
+            # without RETURNING the ids are read first in the same transaction
+            existing = select([table.c.id]).where(condition)
+            affected = [questionId for (questionId,)
+                        in db.session.execute(existing)]
+            db.session.execute(statement)
+
+        if (affected):
+            bump_versions(db.session.connection(), [Question.__tablename__])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if (affected):
+        # set based statements bypass the session events
+        notify_change(Question.__tablename__, 'reset')
+
+    found = set(affected)
+    return {
+        'affected': len(affected),
+        'missing': [questionId for questionId in (ids or [])
+                    if questionId not in found]
+    }
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from backend.models import Category, on_change
+from backend.serializer import serializer, Raw
+from backend.conditional import request_version
+from backend.bulk import parse_integer
+
+
+CATEGORY_CACHE_TTL = 300  # seconds
+
+
+class CategoryCache:
+    """
+    Keeps the formatted categories in memory so that requests don't need to
+    hit the database to validate or list them. The cache is reloaded once the
+    ttl expires, whenever a committed session changes the categories table
+    and when a conditional request read a version of the table other than
+    the one loaded (the changes made by other processes).
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (list of formatted categories, dictionary of categories by id,
+        #  json of the list)
+        self._entry = None
+        self._expires = 0.0
+        self._version = None  # of the categories table, None if unknown
+
+    def _load(self):
+        version = request_version(Category.__tablename__)
+        with self._lock:
+            if (self._entry is not None and time.monotonic() < self._expires
+                    and version in (None, self._version)):
+                self.hits += 1
+                return self._entry
+
+            self.misses += 1
+            data = [datum.format()
+                    for datum in Category.query.order_by(Category.id.asc())]
+            self._entry = (data, {datum['id']: datum for datum in data},
+                           Raw(serializer.dumps(data)))
+            self._expires = time.monotonic() + self.ttl
+            # the rows are at least as recent as the version read before
+            self._version = version
+            return self._entry
+
+    def all(self):
+        """ returns the list of formatted categories ordered by id """
+        return self._load()[0]
+
+    def encoded(self):
+        """ returns the list of categories as a json fragment """
+        return self._load()[2]
+
+    def get(self, categoryId):
+        """ returns the formatted category or None if it does not exist """
+        index = self._load()[1]
+        # the same ids as the imported rows, no booleans nor fractions
+        return index.get(parse_integer(categoryId))
+
+    def find(self, categoryType: str):
+        """ returns the first category whose type contains categoryType """
+        needle = categoryType.lower()
+        for datum in self.all():
+            if (needle in (datum['type'] or '').lower()):
+                return datum
+        return None
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'ratio': self.hits / lookups if lookups else None,
+            'ttl': self.ttl
+        }
+
+
+category_cache = CategoryCache()
+
+
+@on_change
+def invalidate_categories(table, operation, records):
+    if (table == Category.__tablename__):
+        category_cache.invalidate()
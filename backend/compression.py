@@ -0,0 +1,115 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # only gzip is offered
+    brotli = None
+
+
+COMPRESSION_MIN_SIZE = 1024  # bytes, smaller bodies are sent as they are
+COMPRESSION_LEVEL = 6  # gzip level 1 to 9, 0 disables the compression
+BROTLI_QUALITY = 5  # brotli quality 0 to 11
+COMPRESSION_CACHE_SIZE = 256  # compressed bodies kept per process
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+class Compressor:
+    """
+    Compresses the response bodies with the best encoding the client accepts
+    (brotli when installed, then gzip). Bodies under minSize are left alone.
+    The bodies of responses carrying an ETag are the same for a given url
+    and ETag, so they are compressed once and kept in a small LRU cache.
+    """
+
+    def __init__(self, minSize=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL,
+                 quality=BROTLI_QUALITY, cacheSize=COMPRESSION_CACHE_SIZE):
+        self.minSize = minSize
+        self.level = level
+        self.quality = quality
+        self.cacheSize = cacheSize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (url, etag, encoding) -> compressed body, least recently used first
+        self._cache = OrderedDict()
+
+    @property
+    def encodings(self):
+        """ the encodings offered, preferred first """
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def compress(self, body: bytes, encoding: str):
+        if (encoding == 'br'):
+            return brotli.compress(body, quality=self.quality)
+        return gzip.compress(body, compresslevel=self.level)
+
+    def _cached(self, key, body: bytes, encoding: str):
+        with self._lock:
+            compressed = self._cache.get(key)
+            if (compressed is not None):
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return compressed
+            self.misses += 1
+
+        compressed = self.compress(body, encoding)
+        with self._lock:
+            self._cache[key] = compressed
+            while (len(self._cache) > self.cacheSize):
+                self._cache.popitem(last=False)
+        return compressed
+
+    def compressible(self, response):
+        if (self.level <= 0 or response.status_code != 200):
+            return False
+        if (response.direct_passthrough or response.is_streamed):
+            return False  # streamed responses are sent as they are produced
+        if ('Content-Encoding' in response.headers):
+            return False
+        mimetype = response.mimetype or ''
+        return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+    def apply(self, response, request):
+        """ compresses the response in place if the request accepts it """
+        if (not self.compressible(response)):
+            return response
+        body = response.get_data()
+        if (len(body) < self.minSize):
+            return response
+
+        # the body now depends on the Accept-Encoding of the request
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if (encoding is None):
+            return response
+
+        etag = response.get_etag()[0]
+        if (etag is not None and self.cacheSize > 0):
+            compressed = self._cached(
+                (request.full_path, etag, encoding), body, encoding)
+        else:
+            compressed = self.compress(body, encoding)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'ratio': self.hits / lookups if lookups else None,
+            'size': len(self._cache),
+            'encodings': list(self.encodings)
+        }
+
+
+compressor = Compressor()
@@ -0,0 +1,63 @@
+import functools
+
+from flask import g, request, make_response, current_app, \
+    has_request_context
+from backend.models import get_versions
+
+
+def request_version(table: str):
+    """
+    returns the version of table read by the conditional view serving this
+    request, None if it didn't read it. The in-process caches compare it
+    with the version they loaded, so that a change made by another process
+    is never served under its new ETag
+    """
+    if (not has_request_context()):
+        return None
+    return g.get('table_versions', {}).get(table)
+
+
+"""
+conditional(*tables)
+    decorates a GET view so that its responses carry an ETag and a
+    Last-Modified header built from the version of the tables it reads.
+    Requests with a matching If-None-Match (or an If-Modified-Since not older
+    than the last change) get a 304 without running the view.
+"""
+
+
+def conditional(*tables):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(tables)
+            g.table_versions = {
+                name: versions[name].version if name in versions else 0
+                for name in tables}
+            etag = '-'.join(f'{name}.{version}'
+                            for name, version in g.table_versions.items())
+            modified = max([version.modified for version in versions.values()],
+                           default=None)
+            if (modified is not None):
+                modified = modified.replace(microsecond=0)
+
+            if (request.if_none_match):
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                fresh = modified is not None \
+                    and request.if_modified_since is not None \
+                    and modified <= request.if_modified_since
+
+            if (fresh):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if (response.status_code != 200):
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if (modified is not None):
+                response.last_modified = modified
+            return response
+        return wrapper
+    return decorator
@@ -3,6 +3,10 @@ import sys
 from dotenv import load_dotenv
 
 
+def parse_flag(value: str):
+    return value.lower() in ('1', 'true', 'yes')
+
+
 def load_config(env=".env"):
     # Grabs the folder where the script runs.
     basedir = os.path.abspath(os.path.dirname(__file__))
@@ -28,6 +32,40 @@ def load_config(env=".env"):
 
         DATABASE_URI = os.environ['DATABASE_URI']
 
+        # Connection pool. Unset values keep the SQLAlchemy defaults
+        DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+        DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        # seconds after which a connection is replaced (-1 never)
+        DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))
+        DB_POOL_PRE_PING = parse_flag(
+            os.environ.get('DB_POOL_PRE_PING', 'False'))
+        # milliseconds before postgreSQL cancels a statement (0 disables it)
+        DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+        # leaves the pooling to PgBouncer (transaction pooling compatible)
+        DB_PGBOUNCER = parse_flag(os.environ.get('DB_PGBOUNCER', 'False'))
+
+        # applies the pending migrations at startup (else run flask migrate)
+        DB_AUTO_MIGRATE = parse_flag(
+            os.environ.get('DB_AUTO_MIGRATE', 'True'))
+
+        # Optional read replica for the read only endpoints
+        DATABASE_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URI', None)
+        # seconds of replication lag tolerated before reading from the primary
+        REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+
+        return {
+            'DATABASE_URI': DATABASE_URI,
+            'DATABASE_REPLICA_URI': DATABASE_REPLICA_URI,
+            'REPLICA_MAX_LAG': REPLICA_MAX_LAG,
+            'DB_POOL_SIZE': DB_POOL_SIZE,
+            'DB_MAX_OVERFLOW': DB_MAX_OVERFLOW,
+            'DB_POOL_RECYCLE': DB_POOL_RECYCLE,
+            'DB_POOL_PRE_PING': DB_POOL_PRE_PING,
+            'DB_STATEMENT_TIMEOUT': DB_STATEMENT_TIMEOUT,
+            'DB_PGBOUNCER': DB_PGBOUNCER,
+            'DB_AUTO_MIGRATE': DB_AUTO_MIGRATE
+        }
+
     except Exception as err:
         # Log the error to the console
         print("Error retrieving configuration values: ", err)
@@ -0,0 +1,227 @@
+import time
+import random
+import itertools
+import threading
+
+from backend.models import db, Question, TableVersion, on_change, \
+    committed_version
+
+
+DECK_PROBES = 8  # random slots tried before scanning the deck
+DECK_COMPACT_RATIO = 0.5  # share of tombstones that triggers a rebuild
+DECK_VERSION_CHECK = 1.0  # seconds between two checks of the questions version
+
+generations = itertools.count(1)
+
+
+class Deck:
+    """
+    A shuffled permutation of the ids of the questions of a category (or of
+    all of them), optionally of a single difficulty. Deleted questions leave
+    a tombstone (None) so the other slots keep their position, new questions
+    are swapped in at a random slot. Quiz sessions walk the deck by position;
+    the generation changes whenever the positions are rebuilt.
+    """
+
+    def __init__(self, ids, key=(None, None)):
+        self.key = key  # (category id, difficulty), None matches any
+        self.ids = list(ids)
+        random.shuffle(self.ids)
+        self.positions = {questionId: position
+                          for position, questionId in enumerate(self.ids)}
+        self.generation = next(generations)
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return len(self.positions)
+
+    def add(self, questionId: int):
+        with self._lock:
+            if (questionId in self.positions):
+                return
+            # appends and swaps with a random slot, so the deck stays a
+            # uniform shuffle
+            self.ids.append(questionId)
+            last = len(self.ids) - 1
+            swap = random.randint(0, last)
+            self.ids[last], self.ids[swap] = self.ids[swap], self.ids[last]
+            if (self.ids[last] is not None):
+                self.positions[self.ids[last]] = last
+            self.positions[questionId] = swap
+
+    def remove(self, questionId: int):
+        with self._lock:
+            position = self.positions.pop(questionId, None)
+            if (position is None):
+                return
+            self.ids[position] = None
+            tombstones = len(self.ids) - self.alive
+            if (tombstones > len(self.ids) * DECK_COMPACT_RATIO):
+                self._compact()
+
+    def _compact(self):
+        self.ids = [questionId for questionId in self.ids
+                    if questionId is not None]
+        self.positions = {questionId: position
+                          for position, questionId in enumerate(self.ids)}
+        self.generation = next(generations)
+
+    def walk(self, session):
+        """ returns the next id of the deck the session has not seen """
+        with self._lock:
+            generation, position = session.cursors.get(self.key, (None, 0))
+            if (generation != self.generation):
+                # restarts, the seen ids skip what was already asked
+                position = 0
+            questionId = None
+            while (questionId is None and position < len(self.ids)):
+                questionId = self.ids[position]
+                position += 1
+                if (questionId is not None and session.has_seen(questionId)):
+                    questionId = None
+            session.cursors[self.key] = (self.generation, position)
+            return questionId
+
+    def sample(self, exclude):
+        """ returns a random id not in exclude, None if there is none """
+        with self._lock:
+            if (not self.ids):
+                return None
+            for probe in range(DECK_PROBES):
+                questionId = self.ids[random.randrange(len(self.ids))]
+                if (questionId is not None and questionId not in exclude):
+                    return questionId
+            left = [questionId for questionId in self.positions
+                    if questionId not in exclude]
+            return random.choice(left) if left else None
+
+    def count(self, exclude):
+        """ number of ids of the deck not in exclude """
+        return self.alive - sum(1 for questionId in exclude
+                                if questionId in self.positions)
+
+    def matches(self, record):
+        """ true if the formatted question belongs to the deck """
+        categoryId, difficulty = self.key
+        return (categoryId is None or categoryId == record['category']) \
+            and (difficulty is None or difficulty == record['difficulty'])
+
+
+class QuestionDecks:
+    """
+    The decks of the process keyed by category id (None for every question)
+    and difficulty (None for every difficulty), built on first use and kept
+    up to date by the change notifications. Picking a question of a range of
+    difficulties only touches the deck of each difficulty, however many
+    questions there are. The version of the questions table is checked at
+    most every DECK_VERSION_CHECK seconds, the decks are dealt again once
+    another process changed the questions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decks = {}
+        self._version = None  # of the questions table, None if unknown
+        self._checked = 0.0
+
+    def check(self):
+        """ drops the decks if the questions changed in another process """
+        with self._lock:
+            if (time.monotonic() - self._checked < DECK_VERSION_CHECK):
+                return
+            self._checked = time.monotonic()
+        # read before the decks are dealt, they are at least as recent
+        version = db.session.query(TableVersion.version) \
+            .filter(TableVersion.name == Question.__tablename__) \
+            .scalar() or 0
+        with self._lock:
+            if (version != self._version):
+                self._decks = {}
+                self._version = version
+
+    def advance(self, versions):
+        """ same as QuestionStore.advance """
+        with self._lock:
+            if (versions is None or self._version not in versions):
+                self._version = None
+            else:
+                self._version = versions[1]
+
+    def get(self, categoryId=None, difficulty=None):
+        key = (categoryId, difficulty)
+        with self._lock:
+            deck = self._decks.get(key)
+            if (deck is None):
+                # served by the (category, difficulty) index
+                query = db.session.query(Question.id)
+                if (categoryId is not None):
+                    query = query.filter(Question.category == categoryId)
+                if (difficulty is not None):
+                    query = query.filter(Question.difficulty == difficulty)
+                deck = Deck((questionId for (questionId,) in query), key)
+                self._decks[key] = deck
+            return deck
+
+    def within(self, categoryId, difficulties):
+        """ the decks of the (min, max) difficulties, or the whole one """
+        self.check()
+        if (difficulties is None):
+            return [self.get(categoryId)]
+        low, high = difficulties
+        return [self.get(categoryId, difficulty)
+                for difficulty in range(low, high + 1)]
+
+    def built(self):
+        with self._lock:
+            return list(self._decks.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._decks = {}
+            self._version = None
+            self._checked = 0.0
+
+
+question_decks = QuestionDecks()
+
+
+@on_change
+def update_decks(table, operation, records):
+    if (table != Question.__tablename__):
+        return
+    if (operation == 'reset'):
+        question_decks.invalidate()
+        return
+    for deck in question_decks.built():
+        for record in records:
+            if (operation == 'delete'):
+                deck.remove(record['id'])
+            elif (deck.matches(record)):
+                deck.add(record['id'])
+            else:  # the category or difficulty of the question changed
+                deck.remove(record['id'])
+    question_decks.advance(committed_version(table))
+
+
+"""
+weighted_order(decks)
+    returns the decks in a random order where each deck comes first with a
+    probability proportional to its number of questions. Drawing from the
+    first deck is then uniform over the questions of all the decks
+"""
+
+
+def weighted_order(decks):
+    # Efraimidis-Spirakis: sorts on u ** (1 / weight), u uniform in [0, 1)
+    return sorted(decks, key=lambda deck: random.random() ** (1 / deck.alive)
+                  if deck.alive else -1.0, reverse=True)
+
+
+def sample_decks(decks, exclude):
+    """ returns a random id of the decks not in exclude or None """
+    for deck in weighted_order(decks):
+        questionId = deck.sample(exclude)
+        if (questionId is not None):
+            return questionId
+    return None
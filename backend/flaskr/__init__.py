@@ -1,25 +1,157 @@
+import os
 import sys
-import random
+import json
+import base64
 
-from flask import Flask, request, abort, jsonify, make_response
+import click
+from flask import Flask, g, request, abort, jsonify, make_response
 from flask_api import status
 from werkzeug import exceptions
 from flask_cors import CORS, cross_origin
-from backend.models import setup_db, db, Question, Category
-from backend.config import load_config
+from backend.models import setup_db, db, Question, \
+    select_questions, format_question_row, count_by_category, \
+    count_questions, paginate_query
+from backend.config import load_config, parse_flag
+from backend.cache import category_cache, CATEGORY_CACHE_TTL
+from backend.search import question_search, SEARCH_RESULTS_LIMIT
+from backend.streaming import stream_json
+from backend.serializer import serializer, json_response
+from backend.compression import compressor, COMPRESSION_MIN_SIZE, \
+    COMPRESSION_LEVEL, BROTLI_QUALITY, COMPRESSION_CACHE_SIZE
+from backend.conditional import conditional
+from backend.metrics import install_metrics, errors_total, caches
+from backend.decks import question_decks, sample_decks
+from backend.store import question_store, question_row, QUESTION_STORE_TTL
+from backend.quiz import quiz_sessions, next_question, \
+    MemorySessionStore, RedisSessionStore, QUIZ_SESSION_TTL, \
+    QUIZ_MAX_SESSIONS
+from backend.replica import setup_replica, read_only
+from backend.migrations import migrate, status as migration_status
+from backend.ratelimit import rate_limiter, rate_limited, parse_budget, \
+    MemoryStore, RedisStore, RATE_LIMITS, RATE_LIMIT_MAX_CLIENTS
+from backend.bulk import import_questions, mutate_questions, \
+    validate_fields, IMPORT_FORMATS, IMPORT_CHUNK_SIZE, BATCH_ACTIONS, \
+    BATCH_FIELDS
 
 
 QUESTIONS_PER_PAGE = 10
 MAX_DIFFICULTY = 10
 
 
+def encode_cursor(lastId: int):
+    """ wraps the last id of a page in an opaque, url safe cursor """
+    payload = json.dumps({'after': lastId}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """ returns the id in the cursor (0 if empty) or None if invalid """
+    if (cursor == ''):
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        lastId = json.loads(base64.urlsafe_b64decode(padded))['after']
+        return lastId if isinstance(lastId, int) else None
+    except Exception:
+        return None
+
+
+def difficulty_range(minDifficulty=None, maxDifficulty=None):
+    """
+    returns the (min, max) difficulties to filter on, None when they cover
+    every difficulty. Raises a ValueError if a bound is not an integer
+    between 1 and MAX_DIFFICULTY or min is greater than max
+    """
+    low = 1 if minDifficulty is None else minDifficulty
+    high = MAX_DIFFICULTY if maxDifficulty is None else maxDifficulty
+    for bound in (low, high):
+        if (type(bound) is not int or bound < 1 or bound > MAX_DIFFICULTY):
+            raise ValueError(
+                f'Difficulties must be integers between 1 and {MAX_DIFFICULTY}')
+    if (low > high):
+        raise ValueError('minDifficulty is greater than maxDifficulty')
+    if (low == 1 and high == MAX_DIFFICULTY):
+        return None
+    return (low, high)
+
+
+def difficulty_args(args):
+    """ the difficulty_range of the minDifficulty and maxDifficulty args """
+    return difficulty_range(
+        args.get('minDifficulty', None, type=int),  # type: ignore
+        args.get('maxDifficulty', None, type=int))  # type: ignore
+
+
 def create_app(env_config=".env"):
     # create and configure the app
     app = Flask(__name__)
-    load_config(env_config)
-    setup_db(app)
+    config = load_config(env_config)
+    setup_db(app, config)
+    setup_replica(app, config)
     db.session.expire_all()
 
+    # orjson (when installed) or json, both encode like jsonify
+    serializer.use(os.environ.get('JSON_SERIALIZER', None))
+
+    # categories are shared across requests and reloaded after the ttl
+    category_cache.ttl = int(os.environ.get(
+        'CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL))
+    category_cache.invalidate()
+
+    # optional in memory copy of the questions, loaded before the first
+    # request
+    question_store.enabled = parse_flag(
+        os.environ.get('QUESTION_STORE', 'False'))
+    question_store.ttl = int(os.environ.get(
+        'QUESTION_STORE_TTL', QUESTION_STORE_TTL))
+    question_store.invalidate()
+    if (question_store.enabled):
+        with app.app_context():
+            question_store.load()
+
+    # quizzes expire after the ttl, kept in memory or in redis when their
+    # requests may reach any of several workers
+    quiz_sessions.ttl = int(os.environ.get(
+        'QUIZ_SESSION_TTL', QUIZ_SESSION_TTL))
+    quizStorageUrl = os.environ.get('QUIZ_STORAGE_URL', None)
+    if (quizStorageUrl):
+        quiz_sessions.store = RedisSessionStore.from_url(quizStorageUrl)
+    else:
+        quiz_sessions.store = MemorySessionStore(int(os.environ.get(
+            'QUIZ_MAX_SESSIONS', QUIZ_MAX_SESSIONS)))
+
+    # gzip (or brotli when installed) for the bodies above the minimum size
+    compressor.minSize = int(os.environ.get(
+        'COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE))
+    compressor.level = int(os.environ.get(
+        'COMPRESSION_LEVEL', COMPRESSION_LEVEL))
+    compressor.quality = int(os.environ.get('BROTLI_QUALITY', BROTLI_QUALITY))
+    compressor.cacheSize = int(os.environ.get(
+        'COMPRESSION_CACHE_SIZE', COMPRESSION_CACHE_SIZE))
+    compressor.invalidate()
+
+    # token buckets per client on the routes decorated with rate_limited,
+    # kept in memory or in redis when shared by several workers
+    rate_limiter.enabled = parse_flag(os.environ.get('RATE_LIMIT', 'False'))
+    for name, budget in RATE_LIMITS.items():
+        rate_limiter.budgets[name] = parse_budget(
+            os.environ.get(f'RATE_LIMIT_{name.upper()}', budget))
+    rate_limiter.apiKeys = frozenset(
+        apiKey.strip() for apiKey
+        in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',')
+        if apiKey.strip())
+    storageUrl = os.environ.get('RATE_LIMIT_STORAGE_URL', None)
+    if (storageUrl):
+        rate_limiter.store = RedisStore.from_url(storageUrl)
+    else:
+        rate_limiter.store = MemoryStore(int(os.environ.get(
+            'RATE_LIMIT_MAX_CLIENTS', RATE_LIMIT_MAX_CLIENTS)))
+
+    # request, error, pool and cache metrics exposed on /metrics
+    install_metrics(app)
+    caches['categories'] = category_cache
+    caches['compressed'] = compressor
+
     """
     #TODO [X]: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
     """
@@ -36,71 +168,105 @@ def create_app(env_config=".env"):
                              'GET,PATCH,POST,DELETE,OPTIONS')
         return response
 
+    @app.after_request
+    def compress_response(response):
+        # negotiates the encoding with the Accept-Encoding of the client
+        return compressor.apply(response, request)
+
     """
     #TODO [X]: Create an endpoint to handle GET requests for all available categories.
     """
     @app.route('/api/v1.0/categories', methods=['GET'])
     @cross_origin()
+    @read_only
+    @conditional('categories')
     def get_categories():
         try:
-            data = Category.query.all()
-            formattedData = [datum.format() for datum in data]
             # returns the formatted data or an empty array
-            return jsonify({
+            return json_response({
                 'success': True,
-                'data': formattedData
+                'data': category_cache.encoded()
             })
 
         except Exception as err:
             return internal_error(err)
 
+    @app.route('/api/v1.0/cache', methods=['GET'])
+    @cross_origin()
+    def get_cache_stats():
+        # exposes the hits and misses of the shared caches
+        return jsonify({
+            'success': True,
+            'data': {
+                'categories': category_cache.stats(),
+                'compressed': compressor.stats()
+            }
+        })
+
     @app.route('/api/v1.0/categories/<int:categoryId>', methods=['GET'])
     @cross_origin()
+    @read_only
+    @conditional('categories')
     def get_category(categoryId=int):
         try:
 
             # retrieves the appropriate category data
-            # (eventually refactor to own function or lambda)
-            category: Category = Category.query.get(categoryId)
+            category = category_cache.get(categoryId)
 
             if (category is None):
                 return unprocessable("Category does not exist")
 
-            formattedData = category.format()
-
             return jsonify({
                 'success': True,
-                'data': formattedData
+                'data': category
             })
 
         except Exception as err:
             print(sys.exc_info(), err)
             return internal_error(err)
 
+    def category_questions(categoryId, difficulties):
+        # the questions of a category ordered by id, within the difficulties
+        if (question_store.active()):
+            return question_store.rows(categoryId, difficulties=difficulties)
+        query = select_questions() \
+            .order_by(Question.id.asc()) \
+            .filter(Question.category == categoryId)
+        if (difficulties is not None):
+            query = query.filter(Question.difficulty.between(*difficulties))
+        return query
+
     @app.route('/api/v1.0/categories/<int:categoryId>/questions',
                methods=['GET'])
     @cross_origin()
+    @read_only
+    @conditional('questions', 'categories')
     def get_questions_by_category2(categoryId=int):
         try:
 
+            stream = request.args.get(
+                'stream', False, type=parse_flag)  # type: ignore
+            try:
+                difficulties = difficulty_args(request.args)
+            except ValueError as err:
+                return unprocessable(str(err))
+
             # retrieves the appropriate category data
-            # (eventually refactor to own function or lambda)
-            category: Category = Category.query.get(categoryId)
+            category = category_cache.get(categoryId)
 
             if (category is None):
                 return unprocessable("Category does not exist")
 
-            result = Question.query \
-                .order_by(Question.id.asc()) \
-                .filter(Question.category == category.id) \
-                .all()
+            records = category_questions(category['id'], difficulties)
 
-            formattedData = [datum.format() for datum in result]
+            if (stream):
+                return stream_json({'success': True, 'category': category},
+                                   'data', records, format_question_row)
 
-            return jsonify({
+            return json_response({
                 'success': True,
-                'category': category.format(),
-                'data': formattedData
+                'category': category,
+                'data': serializer.questions(records)
             })
 
         except Exception as err:
@@ -118,6 +284,8 @@ def create_app(env_config=".env"):
     """
     @app.route('/api/v1.0/questions', methods=['GET'])
     @cross_origin()
+    @read_only
+    @conditional('questions', 'categories')
     def get_questions():
         try:
             # gets the params
@@ -126,37 +294,91 @@ def create_app(env_config=".env"):
                 'perPage', QUESTIONS_PER_PAGE, type=int)  # type: ignore
             categoryId = request.args.get(
                 'category', None, type=int)  # type: ignore
+            # keyset pagination is used when either a cursor or an id is
+            # passed in
+            cursor = request.args.get('cursor', None, type=str)  # type: ignore
+            afterId = request.args.get(
+                'after_id', None, type=int)  # type: ignore
+            withTotal = request.args.get(
+                'withTotal', False, type=parse_flag)  # type: ignore
+            try:
+                difficulties = difficulty_args(request.args)
+            except ValueError as err:
+                return unprocessable(str(err))
 
             # retrieves the appropriate data
-            query = Question.query.order_by(Question.id.asc())
+            query = select_questions().order_by(Question.id.asc())
+            if (difficulties is not None):
+                query = query.filter(Question.difficulty.between(
+                    *difficulties))
             if (categoryId is not None):
                 # makes sure we get a valid category if one is passed in
-                categoryObj = Category.query.get(categoryId)
+                categoryObj = category_cache.get(categoryId)
                 if (categoryObj is None):
                     return unprocessable("Database error. Category not found.")
-                categoryObj = categoryObj.format()
                 query = query.filter(Question.category == categoryId)
             else:
                 categoryObj = None
 
-            # errors if invalid pagenumber
-            result = query.paginate(page=pageNumber, per_page=itemsPerPage)
-
-            # formats the data for output
-            formattedData = [datum.format() for datum in result.items]
+            if (cursor is not None or afterId is not None):
+                if (cursor is not None):
+                    afterId = decode_cursor(cursor)
+                    if (afterId is None):
+                        return unprocessable("Invalid cursor")
+                if (itemsPerPage < 1):
+                    return unprocessable("perPage must be greater than 0")
+
+                # seeks past the last id instead of counting the skipped rows
+                # and reads one extra row to know if there is a next page
+                if (question_store.active()):
+                    rows = question_store.rows(
+                        categoryId, afterId=afterId, limit=itemsPerPage + 1,
+                        difficulties=difficulties)
+                else:
+                    rows = query \
+                        .filter(Question.id > afterId) \
+                        .limit(itemsPerPage + 1) \
+                        .all()
+                items = rows[:itemsPerPage]
+                total = None
+                if (withTotal):
+                    total = question_store.count(categoryId, difficulties) \
+                        if question_store.active() \
+                        else count_questions(categoryId, difficulties)
+                nextCursor = encode_cursor(items[-1].id) \
+                    if len(rows) > itemsPerPage else None
+
+                return json_response({
+                    'success': True,
+                    'data': serializer.questions(items),
+                    'total': total,
+                    'category': categoryObj,
+                    'categories': category_cache.encoded(),
+                    'cursor': nextCursor,
+                    'perPage': itemsPerPage
+                })
 
-            # gets the available categories. Returns an error if it can't find
-            # any
-            categoryData = Category.query.all()
-            if (categoryData is None):
+            # errors if invalid pagenumber
+            if (question_store.active()):
+                result = question_store.paginate(
+                    categoryId, pageNumber, itemsPerPage, difficulties)
+            else:
+                # the total is read from the per category counters
+                result = paginate_query(
+                    query, pageNumber, itemsPerPage,
+                    count_questions(categoryId, difficulties))
+
+            # gets the available categories already encoded. Returns an
+            # error if it can't find any
+            formattedCategoryData = category_cache.encoded()
+            if (formattedCategoryData is None):
                 raise Exception(
                     'Database error. Unable to retrieve categories')
-            formattedCategoryData = [datum.format() for datum in categoryData]
 
-            # formats the response
-            return jsonify({
+            # encodes the rows straight into the response
+            return json_response({
                 'success': True,
-                'data': formattedData,
+                'data': serializer.questions(result.items),
                 'total': result.total,
                 'category': categoryObj,
                 'categories': formattedCategoryData,
@@ -175,6 +397,76 @@ def create_app(env_config=".env"):
             print(sys.exc_info(), err)
             return internal_error(err)
 
+    @app.route('/api/v1.0/dashboard', methods=['GET'])
+    @cross_origin()
+    @read_only
+    @conditional('questions', 'categories')
+    def get_dashboard():
+        try:
+            # same arguments as GET /api/v1.0/questions (page based)
+            pageNumber = request.args.get('page', 1, type=int)  # type: ignore
+            itemsPerPage = request.args.get(
+                'perPage', QUESTIONS_PER_PAGE, type=int)  # type: ignore
+            categoryId = request.args.get(
+                'category', None, type=int)  # type: ignore
+            try:
+                difficulties = difficulty_args(request.args)
+            except ValueError as err:
+                return unprocessable(str(err))
+
+            if (categoryId is not None):
+                categoryObj = category_cache.get(categoryId)
+                if (categoryObj is None):
+                    return unprocessable("Database error. Category not found.")
+            else:
+                categoryObj = None
+
+            # the counters of every category (or one grouped count when
+            # filtered on the difficulty) give the totals, the page is the
+            # only other query
+            if (question_store.active()):
+                counts = question_store.counts(difficulties)
+            else:
+                counts = count_by_category(difficulties)
+            totalQuestions = sum(counts.values())
+            total = totalQuestions if categoryId is None \
+                else counts.get(categoryId, 0)
+
+            if (question_store.active()):
+                result = question_store.paginate(
+                    categoryId, pageNumber, itemsPerPage, difficulties)
+            else:
+                query = select_questions().order_by(Question.id.asc())
+                if (categoryId is not None):
+                    query = query.filter(Question.category == categoryId)
+                if (difficulties is not None):
+                    query = query.filter(Question.difficulty.between(
+                        *difficulties))
+                result = paginate_query(
+                    query, pageNumber, itemsPerPage, total)
+
+            return json_response({
+                'success': True,
+                'data': serializer.questions(result.items),
+                'total': result.total,
+                'category': categoryObj,
+                'categories': category_cache.encoded(),
+                'page': pageNumber,
+                'pages': result.pages,
+                'perPage': itemsPerPage,
+                'counts': [{'id': datum['id'],
+                            'questions': counts.get(datum['id'], 0)}
+                           for datum in category_cache.all()],
+                'totalQuestions': totalQuestions
+            })
+
+        except exceptions.NotFound:
+            return not_found("Database error. Page outside limits.")
+
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return internal_error(err)
+
     """
     #TODO [X]: Create an endpoint to DELETE question using a question ID.
     TEST: When you click the trash icon next to a question, the question will be removed.
@@ -209,7 +501,7 @@ def create_app(env_config=".env"):
             body = request.get_json()  # type: ignore
 
             # checks the category
-            category = Category.query.get(body.get('category', None))
+            category = category_cache.get(body.get('category', None))
             if (category is None):
                 return unprocessable('Invalid data [category not found]')
 
@@ -225,7 +517,7 @@ def create_app(env_config=".env"):
             record: Question = Question(
                 question=question,
                 answer=answer,
-                category=category.id,
+                category=category['id'],
                 difficulty=body.get('difficulty', 0)
             )
             if (record.question != '' and record.answer != ''):
@@ -242,6 +534,124 @@ def create_app(env_config=".env"):
             print(sys.exc_info(), err)
             return internal_error(err)
 
+    @app.route('/api/v1.0/questions/import', methods=['POST'])
+    @cross_origin()
+    def import_question_file():
+        try:
+            # the format defaults to the content type of the request
+            format = request.args.get('format', None, type=str)  # type: ignore
+            if (format is None):
+                format = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+            if (format not in IMPORT_FORMATS):
+                return unprocessable('Invalid format [jsonl or csv]')
+
+            chunkSize = request.args.get(
+                'chunkSize', IMPORT_CHUNK_SIZE, type=int)  # type: ignore
+            if (chunkSize < 1):
+                return unprocessable('chunkSize must be greater than 0')
+
+            # reads the body line by line instead of loading it whole, the
+            # lines are decoded one by one so a bad line is only reported
+            categories = {datum['id'] for datum in category_cache.all()}
+            result = import_questions(
+                request.stream, categories, MAX_DIFFICULTY, format, chunkSize)
+
+            return jsonify({
+                'success': True,
+                **result
+            })
+
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return internal_error(err)
+
+    @app.route('/api/v1.0/questions/batch', methods=['POST'])
+    @cross_origin()
+    def batch_questions():
+        try:
+            body = request.get_json()  # type: ignore
+            if (body is None):
+                return unprocessable('No batch provided')
+
+            action = body.get('action', None)
+            if (action not in BATCH_ACTIONS):
+                return unprocessable('Invalid action [delete or update]')
+
+            # the questions are selected by id, by filter or both
+            ids = body.get('ids', None)
+            if (ids is not None and (
+                    not isinstance(ids, list)
+                    or not all(type(datum) is int for datum in ids))):
+                return unprocessable('Invalid ids [list of integers]')
+
+            filters = body.get('filter', None) or {}
+            if (not isinstance(filters, dict)
+                    or any(field not in BATCH_FIELDS for field in filters)):
+                return unprocessable('Invalid filter [category or difficulty]')
+
+            if (ids is None and not filters):
+                return unprocessable('Either ids or a filter are required')
+
+            # the filter and the values follow the rules of the imported rows
+            categories = {datum['id'] for datum in category_cache.all()}
+            filters, error = validate_fields(
+                filters, categories, MAX_DIFFICULTY)
+            if (error is not None):
+                return unprocessable(error)
+
+            values = None
+            if (action == 'update'):
+                values = body.get('values', None)
+                if (not isinstance(values, dict) or not values
+                        or any(field not in BATCH_FIELDS for field in values)):
+                    return unprocessable(
+                        'Invalid values [category or difficulty]')
+
+                values, error = validate_fields(
+                    values, categories, MAX_DIFFICULTY)
+                if (error is not None):
+                    return unprocessable(error)
+
+            result = mutate_questions(action, ids, filters, values)
+
+            return jsonify({
+                'success': True,
+                'action': action,
+                **result
+            })
+
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return internal_error(err)
+
+    @app.cli.command('import-questions')
+    @click.argument('file', type=click.File('rb'))
+    @click.option('--format', 'format', type=click.Choice(IMPORT_FORMATS),
+                  default=None, help='Defaults to the file extension.')
+    @click.option('--chunk-size', 'chunkSize', default=IMPORT_CHUNK_SIZE,
+                  type=click.IntRange(min=1), show_default=True)
+    def import_questions_command(file, format, chunkSize):
+        """ Imports the questions of a JSON Lines or CSV file """
+        if (format is None):
+            format = 'csv' if file.name.lower().endswith('.csv') else 'jsonl'
+        categories = {datum['id'] for datum in category_cache.all()}
+        result = import_questions(
+            file, categories, MAX_DIFFICULTY, format, chunkSize)
+        click.echo(json.dumps(result, indent=2))
+
+    @app.cli.command('migrate')
+    @click.option('--target', type=int, default=None,
+                  help='Stops after this version.')
+    @click.option('--status', 'showStatus', is_flag=True,
+                  help='Lists the migrations instead of applying them.')
+    def migrate_command(target, showStatus):
+        """ Applies the pending schema migrations """
+        if (not showStatus):
+            applied = migrate(db.engine, target)
+            click.echo(f'Applied {applied}' if applied else 'Up to date')
+        for version, name, applied in migration_status(db.engine):
+            click.echo(f'{version:04d} {name} {applied or "pending"}')
+
     """
     #TODO [X]: Create a POST endpoint to get questions based on a search term.
     It should return any questions for whom the search term  is a substring of the question.
@@ -251,6 +661,8 @@ def create_app(env_config=".env"):
     """
     @app.route('/api/v1.0/questions/search', methods=['POST'])
     @cross_origin()
+    @rate_limited('search')
+    @read_only
     def find_questions():
         try:
             body = request.get_json()  # type: ignore
@@ -262,21 +674,44 @@ def create_app(env_config=".env"):
             if (search is None):
                 return unprocessable('No search string provided')
 
+            limit = body.get('limit', SEARCH_RESULTS_LIMIT)
+            if (not isinstance(limit, int) or limit < 1):
+                return unprocessable('Invalid limit')
+            try:
+                difficulties = difficulty_range(
+                    body.get('minDifficulty', None),
+                    body.get('maxDifficulty', None))
+            except ValueError as err:
+                return unprocessable(str(err))
+            stream = request.args.get(
+                'stream', False, type=parse_flag)  # type: ignore
+
             # cleans up the string
             search = search.strip()
             result = []
             if (search != ''):  # No point serarching for nothing
-                result = Question.query \
-                    .filter(Question.question.ilike(f'%{search}%')) \
-                    .all()
-
-            formattedData = [datum.format() for datum in result]
-
-            return jsonify({
+                # ranked results served by the search index
+                if (question_store.active()):
+                    result = question_store.search(
+                        search, limit, difficulties)
+                else:
+                    result = question_search.search(
+                        search, limit, difficulties)
+
+            if (stream):
+                return stream_json({
+                    'success': True,
+                    'query': search,
+                    'found': lambda count: count
+                }, 'data', result, format_question_row)
+
+            rows = list(result)
+
+            return json_response({
                 'success': True,
                 'query': search,
-                'data': formattedData,
-                'found': len(formattedData)
+                'data': serializer.questions(rows),
+                'found': len(rows)
             })
 
         except Exception as err:
@@ -291,13 +726,19 @@ def create_app(env_config=".env"):
     """
     @app.route('/api/v1.0/questions/category', methods=['GET'])
     @cross_origin()
+    @read_only
+    @conditional('questions', 'categories')
     def get_questions_by_category():
         try:
-            qry = Category.query
-
             categoryId = request.args.get('id', None, type=int)  # type: ignore
             categoryType: str = request.args.get(
                 'type', None, type=str)  # type: ignore
+            stream = request.args.get(
+                'stream', False, type=parse_flag)  # type: ignore
+            try:
+                difficulties = difficulty_args(request.args)
+            except ValueError as err:
+                return unprocessable(str(err))
 
             if (categoryId is None and categoryType is None):
                 return unprocessable(
@@ -309,30 +750,25 @@ def create_app(env_config=".env"):
                     "Bad category arguments. Submit either category Id or type")
 
             # retrieves the appropriate category data
-            # (eventually refactor to own function or lambda)
             if (categoryType is None):
-                category: Category = qry.get(categoryId)
+                category = category_cache.get(categoryId)
 
             if (categoryId is None):
                 # gets the first item matching or None
-                list = qry \
-                    .filter(Category.type.ilike(f'%{categoryType}%')) \
-                    .all()
-                category: Category = list[0] if list else None
+                category = category_cache.find(categoryType)
             if (category is None):
                 return unprocessable("Category does not exist")
 
-            result = Question.query \
-                .order_by(Question.id.asc()) \
-                .filter(Question.category == category.id) \
-                .all()
+            records = category_questions(category['id'], difficulties)
 
-            formattedData = [datum.format() for datum in result]
+            if (stream):
+                return stream_json({'success': True, 'category': category},
+                                   'data', records, format_question_row)
 
-            return jsonify({
+            return json_response({
                 'success': True,
-                'category': category.format(),
-                'data': formattedData
+                'category': category,
+                'data': serializer.questions(records)
             })
 
         except Exception as err:
@@ -351,42 +787,54 @@ def create_app(env_config=".env"):
     """
     @app.route('/api/v1.0/questions/random', methods=['POST'])
     @cross_origin()
+    @rate_limited('random')
+    @read_only
     def get_random_questions():
         try:
-            qry = Question.query
             body = request.get_json()  # type: ignore
             category: int = body.get('category', None)
             previous = body.get('previous', [])
-
-            # if a category is specified filters the resultset
+            try:
+                difficulties = difficulty_range(
+                    body.get('minDifficulty', None),
+                    body.get('maxDifficulty', None))
+            except ValueError as err:
+                return unprocessable(str(err))
+
+            # if a category is specified draws from its deck, or from the
+            # deck of each difficulty of the range
             if (category is not None):
-                category: Category = Category.query.get(category)
+                category = category_cache.get(category)
                 if (category is None):
                     return unprocessable("Category does not exist")
-                qry = qry.filter(Question.category == category.id)
-
-            # filters out previous questions if necessary
-            if (previous):
-                qry = qry.filter(Question.id.notin_(previous))
-                # TODO [ ] Maybe at a later time verify that all the passed in previous
-                #         ids actually exists and remove the invalid ones from the list
-                #         For right now we just ignore them
-
-            # gets the data
-            # this disregards the possibility of invalid previous entries
-            result = qry.all()
-            available = len(result)
-            if (result):  # something is returned
+            decks = question_decks.within(
+                category['id'] if category is not None else None,
+                difficulties)
+
+            # the previous ids that are not in the decks are ignored
+            exclude = set(previous)
+            available = sum(deck.count(exclude) for deck in decks)
+
+            # picks a random slot of the shuffled decks, so only the chosen
+            # row is loaded
+            rando = None
+            questionId = sample_decks(decks, exclude)
+            while (questionId is not None and rando is None):
+                rando = question_row(questionId)
+                if (rando is None):  # deleted since the deck was dealt
+                    exclude.add(questionId)
+                    questionId = sample_decks(decks, exclude)
+
+            if (rando is not None):  # something is returned
                 available = available - 1  # left over questions in category
-                rando: Question = random.choice(result)
-                formattedData = rando.format()
+                formattedData = format_question_row(rando)
                 previous.append(rando.id)
             else:
                 formattedData = None
 
             return jsonify({
                 'success': True,
-                'category': category.format() if category else None,
+                'category': category,
                 'previous': previous,
                 'data': formattedData,
                 'available': available
@@ -396,12 +844,102 @@ def create_app(env_config=".env"):
             print(sys.exc_info(), err)
             return internal_error(err)
 
+    @app.route('/api/v1.0/quizzes', methods=['POST'])
+    @cross_origin()
+    def post_quiz():
+        try:
+            body = request.get_json(silent=True) or {}  # type: ignore
+            category = body.get('category', None)
+            adaptive = body.get('adaptive', False)
+            if (not isinstance(adaptive, bool)):
+                return unprocessable('adaptive must be a boolean')
+            try:
+                difficulties = difficulty_range(
+                    body.get('minDifficulty', None),
+                    body.get('maxDifficulty', None))
+            except ValueError as err:
+                return unprocessable(str(err))
+            if (adaptive and difficulties is None):
+                # adapts over every difficulty
+                difficulties = (1, MAX_DIFFICULTY)
+
+            # a quiz is played on a category or on all the questions
+            if (category is not None):
+                category = category_cache.get(category)
+                if (category is None):
+                    return unprocessable("Category does not exist")
+
+            session = quiz_sessions.create(category, difficulties, adaptive)
+
+            return jsonify({
+                'success': True,
+                'data': session.format()
+            })
+
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return internal_error(err)
+
+    @app.route('/api/v1.0/quizzes/<string:quizId>', methods=['GET'])
+    @cross_origin()
+    def get_quiz(quizId=str):
+        session = quiz_sessions.get(quizId)
+        if (session is None):
+            return not_found(f'Quiz {quizId} not found or expired.')
+
+        return jsonify({
+            'success': True,
+            'data': session.format()
+        })
+
+    @app.route('/api/v1.0/quizzes/<string:quizId>', methods=['DELETE'])
+    @cross_origin()
+    def delete_quiz(quizId=str):
+        if (not quiz_sessions.remove(quizId)):
+            return not_found(f'Quiz {quizId} not found or expired.')
+
+        return jsonify({
+            'success': True,
+            'deleted': quizId
+        })
+
+    @app.route('/api/v1.0/quizzes/<string:quizId>/next', methods=['POST'])
+    @cross_origin()
+    @read_only
+    def get_next_question(quizId=str):
+        try:
+            session = quiz_sessions.get(quizId)
+            if (session is None):
+                return not_found(f'Quiz {quizId} not found or expired.')
+
+            # the answer to the previous question, if the client graded it
+            body = request.get_json(silent=True) or {}  # type: ignore
+            correct = body.get('correct', None)
+            if (correct is not None and not isinstance(correct, bool)):
+                return unprocessable('correct must be a boolean')
+
+            # the questions already asked are remembered by the session
+            row, available = next_question(session, correct)
+            quiz_sessions.save(session)
+
+            return jsonify({
+                'success': True,
+                'quiz': session.format(),
+                'data': format_question_row(row) if row is not None else None,
+                'available': available
+            })
+
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return internal_error(err)
+
     """
     #TODO [X]:
     Create error handlers for all expected errors including 404 and 422.
     """
     @app.errorhandler(404)
     def not_found(error):
+        errors_total.inc('not_found')
         return jsonify({
             "success": False,
             "error": str(error),
@@ -410,6 +948,7 @@ def create_app(env_config=".env"):
 
     @app.errorhandler(405)
     def not_allowed(error):
+        errors_total.inc('not_allowed')
         return jsonify({
             "success": False,
             "error": error,
@@ -418,14 +957,28 @@ def create_app(env_config=".env"):
 
     @app.errorhandler(422)
     def unprocessable(error):
+        errors_total.inc('unprocessable')
         return jsonify({
             "success": False,
             "error": error,
             "message": "Unprocessable entity"
         }), 422
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        errors_total.inc('too_many_requests')
+        response = jsonify({
+            "success": False,
+            "error": str(error),
+            "message": "Too many requests"
+        })
+        response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        response.headers['Retry-After'] = str(g.get('retry_after', 1))
+        return response
+
     @app.errorhandler(500)
     def internal_error(error: Exception):
+        errors_total.inc('internal_error')
         return jsonify({
             "success": False,
             "error": error.args[0],
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import logging
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+SLOW_QUERY_MS = 200
+
+slow_query_log = logging.getLogger('backend.slow_queries')
+
+
+"""
+instrument(app)
+    counts and times the SQL statements of every request. The totals are
+    returned in a Server-Timing header and the statements slower than
+    SLOW_QUERY_MS milliseconds are written to the backend.slow_queries log
+"""
+
+
+def instrument(app):
+    if ('instrumentation' in app.extensions):  # setup_db called again
+        return
+    app.extensions['instrumentation'] = True
+    app.config.setdefault('SLOW_QUERY_MS', float(
+        os.environ.get('SLOW_QUERY_MS', SLOW_QUERY_MS)))
+
+    # listens on the Engine class so every engine bound to the app is timed
+    if (not event.contains(Engine, 'before_cursor_execute', start_timer)):
+        event.listen(Engine, 'before_cursor_execute', start_timer)
+        event.listen(Engine, 'after_cursor_execute', stop_timer)
+        event.listen(Engine, 'handle_error', drop_timer)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.query_count = 0
+        g.query_time = 0.0
+
+    @app.after_request
+    def add_server_timing(response):
+        if ('request_start' not in g):
+            return response
+        elapsed = (time.perf_counter() - g.request_start) * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={g.query_time * 1000:.2f};desc="{g.query_count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={elapsed:.2f}')
+        return response
+
+
+def start_timer(connection, cursor, statement, parameters, context,
+                executemany):
+    connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def stop_timer(connection, cursor, statement, parameters, context,
+               executemany):
+    elapsed = time.perf_counter() - connection.info['query_start'].pop()
+    if (not has_request_context() or 'query_count' not in g):
+        return
+
+    g.query_count += 1
+    g.query_time += elapsed
+
+    milliseconds = elapsed * 1000
+    if (milliseconds >= current_app.config['SLOW_QUERY_MS']):
+        slow_query_log.warning(json.dumps({
+            'event': 'slow_query',
+            'duration_ms': round(milliseconds, 3),
+            'statement': statement,
+            'executemany': executemany,
+            'method': request.method,
+            'path': request.path
+        }))
+
+
+def drop_timer(context):
+    # after_cursor_execute doesn't fire for the statements that fail, their
+    # start would stay on the pooled connection
+    if (context.connection is None):
+        return
+    starts = context.connection.info.get('query_start')
+    if (starts):
+        starts.pop()
@@ -0,0 +1,210 @@
+import time
+import bisect
+import threading
+
+from flask import g, request, Response
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value) \
+        .replace('\\', '\\\\') \
+        .replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if (extra):
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if (value == float('inf')):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ a monotonically increasing value per combination of labels """
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            yield self.name + format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    """ a value read from a callback when the metrics are collected """
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in sorted(self.collect()):
+            yield self.name + format_labels(self.labels, labels), value
+
+
+class Histogram:
+    """ counts the observations falling in each bucket, plus sum and count """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # labels -> [count per bucket..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if (entry is None):
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(entry))
+                      for labels, entry in self._values.items()]
+        for labels, entry in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield self.name + '_bucket' + format_labels(
+                    self.labels, labels,
+                    f'le="{format_value(bound)}"'), cumulative
+            yield self.name + '_sum' + format_labels(self.labels, labels), \
+                entry[-2]
+            yield self.name + '_count' + format_labels(self.labels, labels), \
+                entry[-1]
+
+
+class Registry:
+    """ renders the registered metrics in the text exposition format """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, value in metric.samples():
+                lines.append(f'{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'trivia_http_requests_total', 'Number of HTTP requests.',
+    ('route', 'method', 'status')))
+request_duration = registry.register(Histogram(
+    'trivia_http_request_duration_seconds', 'HTTP request latency.',
+    ('route', 'method')))
+errors_total = registry.register(Counter(
+    'trivia_errors_total', 'Number of error responses by handler.',
+    ('handler',)))
+pool_checkouts = registry.register(Counter(
+    'trivia_db_pool_checkouts_total',
+    'Number of connections checked out of the pool.'))
+pool_held = registry.register(Histogram(
+    'trivia_db_pool_checkout_seconds',
+    'Time a connection stays checked out of the pool.'))
+
+# name -> object with a stats() method returning hits and misses
+caches = {}
+
+
+def collect_cache_stats(key):
+    return [((name,), cache.stats()[key]) for name, cache in caches.items()]
+
+
+registry.register(Gauge(
+    'trivia_cache_hits', 'Number of cache hits.', ('cache',),
+    lambda: collect_cache_stats('hits')))
+registry.register(Gauge(
+    'trivia_cache_misses', 'Number of cache misses.', ('cache',),
+    lambda: collect_cache_stats('misses')))
+registry.register(Gauge(
+    'trivia_cache_hit_ratio', 'Ratio of cache lookups that were hits.',
+    ('cache',),
+    lambda: [(labels, value or 0)
+             for labels, value in collect_cache_stats('ratio')]))
+
+
+def checkout(dbapiConnection, record, proxy):
+    pool_checkouts.inc()
+    record.info['checkout_start'] = time.perf_counter()
+
+
+def checkin(dbapiConnection, record):
+    start = record.info.pop('checkout_start', None)
+    if (start is not None):
+        pool_held.observe(time.perf_counter() - start)
+
+
+"""
+install_metrics(app)
+    records the requests of the app and exposes the registry on /metrics
+"""
+
+
+def install_metrics(app):
+    if (not event.contains(Pool, 'checkout', checkout)):
+        event.listen(Pool, 'checkout', checkout)
+        event.listen(Pool, 'checkin', checkin)
+
+    @app.before_request
+    def start_metrics_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('metrics_start')
+        if (start is None):
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        requests_total.inc(route, request.method, str(response.status_code))
+        request_duration.observe(
+            time.perf_counter() - start, route, request.method)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,106 @@
+import re
+import pkgutil
+import importlib
+from datetime import datetime
+from collections import namedtuple
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, \
+    select, text
+
+
+# modules named v<version>_<name>.py, applied in version order
+MIGRATION_MODULE = re.compile(r'^v(\d+)_(\w+)$')
+MIGRATION_LOCK = 7436  # postgreSQL advisory lock held while migrating
+
+Migration = namedtuple('Migration', ['version', 'name', 'module'])
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String, nullable=False),
+    Column('applied', DateTime, nullable=False))
+
+SCHEMA_MIGRATIONS_DDL = (
+    'CREATE TABLE IF NOT EXISTS schema_migrations ('
+    'version INTEGER NOT NULL PRIMARY KEY, '
+    'name VARCHAR NOT NULL, '
+    'applied TIMESTAMP NOT NULL)'
+)
+
+
+"""
+migrations()
+    returns the migrations of this package ordered by version. Each module
+    has an upgrade(connection) function and may set OPTIONAL = True when the
+    application works without it (a failure is then reported and the
+    migration retried at the next start)
+"""
+
+
+def migrations():
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = MIGRATION_MODULE.match(info.name)
+        if (match is not None):
+            found.append(Migration(
+                int(match.group(1)), match.group(2),
+                importlib.import_module(f'{__name__}.{info.name}')))
+    return sorted(found, key=lambda migration: migration.version)
+
+
+def lock(connection):
+    # one process migrates at a time, the others wait and find it done
+    if (connection.dialect.name == 'postgresql'):
+        connection.execute(
+            text('SELECT pg_advisory_xact_lock(:key)'), key=MIGRATION_LOCK)
+
+
+def applied_versions(connection):
+    return {version for (version,) in connection.execute(
+        select([schema_migrations.c.version]))}
+
+
+"""
+migrate(engine, target)
+    applies the migrations not recorded in schema_migrations (up to the
+    target version if any), each in its own transaction. Returns the
+    versions applied
+"""
+
+
+def migrate(engine, target=None):
+    with engine.begin() as connection:
+        lock(connection)
+        connection.execute(text(SCHEMA_MIGRATIONS_DDL))
+
+    applied = []
+    for migration in migrations():
+        if (target is not None and migration.version > target):
+            break
+        try:
+            with engine.begin() as connection:
+                lock(connection)
+                if (migration.version in applied_versions(connection)):
+                    continue
+                migration.module.upgrade(connection)
+                connection.execute(schema_migrations.insert().values(
+                    version=migration.version, name=migration.name,
+                    applied=datetime.utcnow()))
+            applied.append(migration.version)
+        except Exception as err:
+            if (not getattr(migration.module, 'OPTIONAL', False)):
+                raise
+            print("Skipping migration", migration.version, migration.name,
+                  err)
+    return applied
+
+
+def status(engine):
+    """ returns the (version, name, applied) of every migration """
+    with engine.begin() as connection:
+        connection.execute(text(SCHEMA_MIGRATIONS_DDL))
+        applied = {row.version: row.applied for row in connection.execute(
+            select([schema_migrations]))}
+    return [(migration.version, migration.name,
+             applied.get(migration.version))
+            for migration in migrations()]
@@ -0,0 +1,30 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+
+"""
+The tables as they were before the migrations. Databases restored from
+trivia.psql already have categories and questions, which are left as they
+are
+"""
+
+metadata = MetaData()
+
+Table('categories', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('type', String))
+
+Table('questions', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('question', String),
+      Column('answer', String),
+      Column('category', Integer),
+      Column('difficulty', Integer))
+
+Table('table_versions', metadata,
+      Column('name', String, primary_key=True),
+      Column('version', Integer, nullable=False),
+      Column('modified', DateTime, nullable=False))
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
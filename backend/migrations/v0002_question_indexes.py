@@ -0,0 +1,21 @@
+from sqlalchemy import text
+
+
+"""
+Indexes of the questions read by category: (category, id) serves the pages
+and keyset pages of a category ordered by id and the counts, (category,
+difficulty) the filters on the difficulty. Keep in sync with
+Question.__table_args__
+"""
+
+QUESTION_INDEXES_DDL = (
+    'CREATE INDEX IF NOT EXISTS ix_questions_category_id '
+    'ON questions (category, id)',
+    'CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty '
+    'ON questions (category, difficulty)'
+)
+
+
+def upgrade(connection):
+    for statement in QUESTION_INDEXES_DDL:
+        connection.execute(text(statement))
@@ -0,0 +1,24 @@
+from sqlalchemy import text
+
+
+"""
+The trigram index used to search the question text on postgreSQL. Other
+databases fall back to the in-process index in backend.search. Creating the
+pg_trgm extension needs the privilege to do so; without the index the
+searches still work, only slower, so a failure doesn't stop the startup
+"""
+
+OPTIONAL = True
+
+SEARCH_INDEX_DDL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+    'ON questions USING gin (question gin_trgm_ops)'
+)
+
+
+def upgrade(connection):
+    if (connection.dialect.name != 'postgresql'):
+        return
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
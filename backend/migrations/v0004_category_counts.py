@@ -0,0 +1,80 @@
+from sqlalchemy import text
+
+
+"""
+The number of questions of each category, kept by triggers on the questions
+table so the totals are read without counting the rows. The questions
+without a category are counted under category 0 (the ids start at 1)
+"""
+
+CATEGORY_COUNTS_DDL = (
+    'CREATE TABLE IF NOT EXISTS category_counts ('
+    'category INTEGER NOT NULL PRIMARY KEY, '
+    'questions INTEGER NOT NULL DEFAULT 0)'
+)
+
+POSTGRESQL_DDL = (
+    '''
+    CREATE OR REPLACE FUNCTION count_category_questions() RETURNS trigger AS $$
+    BEGIN
+        IF (TG_OP IN ('DELETE', 'UPDATE')) THEN
+            UPDATE category_counts SET questions = questions - 1
+            WHERE category = COALESCE(OLD.category, 0);
+        END IF;
+        IF (TG_OP IN ('INSERT', 'UPDATE')) THEN
+            INSERT INTO category_counts (category, questions)
+            VALUES (COALESCE(NEW.category, 0), 1)
+            ON CONFLICT (category)
+            DO UPDATE SET questions = category_counts.questions + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS questions_category_counts ON questions',
+    '''
+    CREATE TRIGGER questions_category_counts
+    AFTER INSERT OR DELETE OR UPDATE OF category ON questions
+    FOR EACH ROW
+    EXECUTE PROCEDURE count_category_questions()
+    ''',
+)
+
+SQLITE_INCREMENT = (
+    'INSERT INTO category_counts (category, questions) '
+    'VALUES (COALESCE(NEW.category, 0), 1) '
+    'ON CONFLICT (category) DO UPDATE SET questions = questions + 1;'
+)
+SQLITE_DECREMENT = (
+    'UPDATE category_counts SET questions = questions - 1 '
+    'WHERE category = COALESCE(OLD.category, 0);'
+)
+SQLITE_DDL = (
+    'CREATE TRIGGER IF NOT EXISTS questions_count_insert '
+    f'AFTER INSERT ON questions BEGIN {SQLITE_INCREMENT} END',
+    'CREATE TRIGGER IF NOT EXISTS questions_count_delete '
+    f'AFTER DELETE ON questions BEGIN {SQLITE_DECREMENT} END',
+    'CREATE TRIGGER IF NOT EXISTS questions_count_update '
+    'AFTER UPDATE OF category ON questions '
+    f'BEGIN {SQLITE_DECREMENT} {SQLITE_INCREMENT} END',
+)
+
+BACKFILL = (
+    'DELETE FROM category_counts',
+    'INSERT INTO category_counts (category, questions) '
+    'SELECT COALESCE(category, 0), count(*) FROM questions '
+    'GROUP BY COALESCE(category, 0)',
+)
+
+
+def upgrade(connection):
+    connection.execute(text(CATEGORY_COUNTS_DDL))
+    if (connection.dialect.name == 'postgresql'):
+        # no question is written between the backfill and the trigger
+        connection.execute(text(
+            'LOCK TABLE questions IN SHARE ROW EXCLUSIVE MODE'))
+        statements = POSTGRESQL_DDL
+    else:
+        statements = SQLITE_DDL
+    for statement in statements + BACKFILL:
+        connection.execute(text(statement))
@@ -1,22 +1,47 @@
 import os
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+import threading
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, Index, event, \
+    func, text, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.engine.url import make_url
+from flask import g, current_app, has_request_context, abort
+from flask_sqlalchemy import SQLAlchemy, Pagination
+from backend.instrumentation import instrument
+from backend.migrations import migrate
 
 db = SQLAlchemy()
 
+# callbacks notified whenever questions or categories change
+change_listeners = []
+# versions changed by the commit whose changes are being notified
+published = threading.local()
+
 """
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+setup_db(app, config)
+    binds a flask application and a SQLAlchemy service. config is the
+    dictionary returned by load_config, used to size the connection pool
 """
 
 
-def setup_db(app):
+def setup_db(app, config=None):
     try:
         app.config["SQLALCHEMY_DATABASE_URI"] = os.environ["DATABASE_URI"]
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = os.environ["TRACK_MODS"]
+        if (config is not None):
+            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(config)
+            app.config["DB_PGBOUNCER"] = config['DB_PGBOUNCER']
+            app.config["DB_STATEMENT_TIMEOUT"] = config['DB_STATEMENT_TIMEOUT']
         db.app = app
         db.init_app(app)
-        db.create_all()
+        instrument(app)
+        # the schema is brought up to date by backend.migrations
+        if (config is None or config['DB_AUTO_MIGRATE']):
+            migrate(db.engine)
+        seed_table_versions()
+        app.extensions['db_pool'] = check_pool(app)
+        app.logger.info("Database pool %s", app.extensions['db_pool'])
     except Exception as err:
         # Log the error to the console
         print("Something went wrong", err)
@@ -24,6 +49,79 @@ def setup_db(app):
         raise err
 
 
+"""
+engine_options(config)
+    translates the pool settings of load_config into create_engine arguments
+"""
+
+
+def engine_options(config):
+    url = make_url(config['DATABASE_URI'])
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+    if (url.drivername.startswith('sqlite')):
+        # sqlite connections are local files, there is nothing to size
+        return options
+
+    if (config['DB_PGBOUNCER']):
+        # PgBouncer pools the server connections, keeping a second pool in
+        # each worker would only hold on to them
+        options['poolclass'] = NullPool
+    else:
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if (timeout and url.drivername.startswith('postgresql')
+            and not config['DB_PGBOUNCER']):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={timeout}'}
+
+    return options
+
+
+def set_local_timeout(connection):
+    # PgBouncer rejects startup options and shares server connections, so the
+    # timeout is set for each transaction instead
+    timeout = int(db.get_app().config['DB_STATEMENT_TIMEOUT'])
+    connection.execute(text(f'SET LOCAL statement_timeout = {timeout}'))
+
+
+"""
+check_pool(app)
+    connects once at startup and returns the effective pool configuration
+"""
+
+
+def check_pool(app):
+    engine = db.get_engine(app)
+    pool = engine.pool
+
+    if (app.config.get('DB_PGBOUNCER')
+            and app.config.get('DB_STATEMENT_TIMEOUT')
+            and engine.dialect.name == 'postgresql'
+            and not event.contains(engine, 'begin', set_local_timeout)):
+        event.listen(engine, 'begin', set_local_timeout)
+
+    with engine.connect() as connection:
+        timeout = None
+        if (engine.dialect.name == 'postgresql'):
+            timeout = connection.execute(
+                text('SHOW statement_timeout')).scalar()
+
+    return {
+        'pool': type(pool).__name__,
+        'size': pool.size() if hasattr(pool, 'size') else None,
+        'max_overflow': getattr(pool, '_max_overflow', None),
+        'recycle': pool._recycle,
+        'pre_ping': pool._pre_ping,
+        'pgbouncer': bool(app.config.get('DB_PGBOUNCER')),
+        'statement_timeout': timeout,
+        'status': pool.status()
+    }
+
+
 """
 Question
 """
@@ -31,6 +129,11 @@ Question
 
 class Question(db.Model):  # type: ignore
     __tablename__ = 'questions'
+    # created by the migrations (see backend/migrations)
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
@@ -65,6 +168,90 @@ class Question(db.Model):  # type: ignore
         }
 
 
+"""
+Read layer
+    read only endpoints select just the question columns as plain tuples and
+    format them directly, skipping the ORM instances and the identity map
+"""
+
+QUESTION_COLUMNS = (
+    Question.id,
+    Question.question,
+    Question.answer,
+    Question.category,
+    Question.difficulty
+)
+
+
+def read_session():
+    """
+    returns the session of the read replica when the current request was
+    routed to it (see backend.replica), the primary session otherwise
+    """
+    if (has_request_context() and g.get('use_replica')):
+        return current_app.extensions['replica'].session
+    return db.session
+
+
+def select_questions():
+    """ returns a query of (id, question, answer, category, difficulty) """
+    return read_session().query(*QUESTION_COLUMNS)
+
+
+def count_by_category(difficulties=None):
+    """
+    returns the number of questions keyed by category id (None for the
+    questions without one) in a single query. Reads the counters of
+    CategoryCount, or groups the questions within the (min, max)
+    difficulties if any
+    """
+    if (difficulties is None):
+        return {category or None: questions
+                for category, questions in read_session().query(
+                    CategoryCount.category, CategoryCount.questions)
+                if questions}
+    query = read_session().query(Question.category, func.count(Question.id)) \
+        .filter(Question.difficulty.between(*difficulties))
+    return dict(query.group_by(Question.category).all())
+
+
+def count_questions(categoryId=None, difficulties=None):
+    """ the number of questions of a category (or of all of them) """
+    if (difficulties is None):
+        query = read_session().query(
+            func.coalesce(func.sum(CategoryCount.questions), 0))
+        if (categoryId is not None):
+            query = query.filter(CategoryCount.category == categoryId)
+        return query.scalar()
+    query = read_session().query(func.count(Question.id)) \
+        .filter(Question.difficulty.between(*difficulties))
+    if (categoryId is not None):
+        query = query.filter(Question.category == categoryId)
+    return query.scalar()
+
+
+def paginate_query(query, page: int, perPage: int, total: int):
+    """ flask_sqlalchemy's paginate (same errors) with a known total """
+    if (page < 1 or perPage < 0):
+        abort(404)
+    items = query.limit(perPage).offset((page - 1) * perPage).all()
+    if (not items and page != 1):
+        abort(404)
+    return Pagination(None, page, perPage, total, items)
+
+
+def format_question_row(row):
+    """ same output as Question.format() for a row of QUESTION_COLUMNS """
+    questionId, question, answer, category, difficulty = row
+    return {
+        'id': questionId,
+        'question': question,
+        'answer': answer,
+        'category': category,
+        'difficulty': difficulty
+    }
+
+
 """
 Category
 """
@@ -84,3 +271,146 @@ class Category(db.Model):  # type: ignore
             'id': self.id,
             'type': self.type
         }
+
+
+"""
+CategoryCount
+    the number of questions of each category (0 for the questions without
+    one), kept by triggers of the database (see the category_counts
+    migration). Never written by the application
+"""
+
+
+class CategoryCount(db.Model):  # type: ignore
+    __tablename__ = 'category_counts'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    questions = Column(Integer, nullable=False, default=0)
+
+
+"""
+TableVersion
+    a change counter per table, bumped in the same transaction as the
+    changes. Used to validate cached responses without reading the rows
+"""
+
+
+class TableVersion(db.Model):  # type: ignore
+    __tablename__ = 'table_versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    modified = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def format(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'modified': self.modified
+        }
+
+
+VERSIONED_TABLES = (Question.__tablename__, Category.__tablename__)
+
+
+def seed_table_versions():
+    existing = {name for (name,) in db.session.query(TableVersion.name)}
+    for name in VERSIONED_TABLES:
+        if (name not in existing):
+            db.session.add(TableVersion(name=name))
+    db.session.commit()
+
+
+def bump_versions(connection, tables):
+    """ bumps the versions of tables, returns the new ones by name """
+    table = TableVersion.__table__
+    for name in sorted(tables):
+        connection.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1,
+                    modified=datetime.utcnow()))
+    # the rows stay locked by the transaction, so these are ours
+    return dict(connection.execute(
+        select([table.c.name, table.c.version])
+        .where(table.c.name.in_(tables))).fetchall())
+
+
+def get_versions(tables):
+    """ returns a dictionary of TableVersion keyed by table name """
+    return {version.name: version for version in read_session()
+            .query(TableVersion).filter(TableVersion.name.in_(tables))}
+
+
+"""
+on_change(callback)
+    registers a callback invoked as callback(table, operation, records) after
+    a session commits inserts, updates or deletes of questions or categories.
+    records is a list of formatted rows. Bulk statements that bypass the
+    session publish a 'reset' operation with no records instead.
+"""
+
+
+def on_change(callback):
+    change_listeners.append(callback)
+    return callback
+
+
+def committed_version(table):
+    """
+    returns the (before, after) versions of table changed by the commit being
+    notified, None outside of the change callbacks or when the version is not
+    known (bulk statements). Caches holding the before version can move to
+    the after version, no other process changed the table in between
+    """
+    return getattr(published, 'versions', {}).get(table)
+
+
+def notify_change(table, operation, records=None):
+    for callback in change_listeners:
+        callback(table, operation, records)
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changes(session, flush_context):
+    # the flushed objects are still listed in new/dirty/deleted at this point
+    changes = session.info.setdefault('changes', [])
+    tables = set()
+    for operation, objects in (('insert', session.new),
+                               ('update', session.dirty),
+                               ('delete', session.deleted)):
+        for obj in objects:
+            if (not isinstance(obj, (Question, Category))):
+                continue
+            if (operation == 'update' and not session.is_modified(obj)):
+                continue
+            changes.append((obj.__tablename__, operation, obj.format()))
+            tables.add(obj.__tablename__)
+
+    if (tables):
+        versions = session.info.setdefault('versions', {})
+        for name, version in bump_versions(
+                session.connection(), tables).items():
+            # each flush bumps once, the first one is the version before
+            versions[name] = (versions.get(name, (version - 1,))[0], version)
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_changes(session):
+    changes = session.info.pop('changes', [])
+    # groups the records by table and operation, keeping the commit order
+    grouped = {}
+    for table, operation, record in changes:
+        grouped.setdefault((table, operation), []).append(record)
+    published.versions = session.info.pop('versions', {})
+    try:
+        for (table, operation), records in grouped.items():
+            notify_change(table, operation, records)
+    finally:
+        published.versions = {}
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('changes', None)
+    session.info.pop('versions', None)
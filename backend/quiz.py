@@ -0,0 +1,318 @@
+import sys
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed for the shared store
+    redis = None
+
+from backend.decks import question_decks, weighted_order
+from backend.store import question_row
+from backend.metrics import registry, Gauge
+
+
+QUIZ_SESSION_TTL = 1800  # seconds of inactivity before a quiz expires
+QUIZ_MAX_SESSIONS = 10000
+ADAPTIVE_RATE = 0.3  # weight of the last answer in the running score
+# the deck cursors of a session only hold in the process that dealt the decks
+PROCESS_ID = secrets.token_hex(8)
+
+
+class QuizSession:
+    """
+    A quiz being played. The ids of the questions already asked are kept in
+    a set, bounded by the answers given, so the client only sends the id of
+    the quiz. The questions are dealt from the decks of the category (one
+    per difficulty when the quiz is limited to a range of difficulties),
+    cursors maps the key of each deck walked to its (generation, next slot).
+
+    The score is a running average of the graded answers, the last ones
+    weighing the most. Adaptive quizzes deal their next question from the
+    difficulty of the range matching the score.
+    """
+    __slots__ = ('id', 'category', 'difficulties', 'adaptive', 'seen',
+                 'answered', 'correct', 'graded', 'score', 'last', 'expires',
+                 'lock', 'cursors')
+
+    def __init__(self, category, expires, difficulties=None, adaptive=False):
+        self.id = secrets.token_urlsafe(16)
+        self.category = category
+        self.difficulties = difficulties  # (min, max) or None for any
+        self.adaptive = adaptive
+        self.seen = set()
+        self.answered = 0
+        self.correct = 0
+        self.graded = 0
+        self.score = 0.5  # starts half way through the difficulties
+        self.last = None  # id of the question waiting for its grade
+        self.expires = expires
+        self.lock = threading.Lock()
+        self.cursors = {}
+
+    def has_seen(self, questionId: int):
+        return questionId in self.seen
+
+    def mark(self, questionId: int):
+        self.seen.add(questionId)
+        self.answered += 1
+        self.last = questionId
+
+    def grade(self, correct: bool):
+        """ records the answer to the last question, once """
+        if (self.last is None):
+            return
+        self.last = None
+        self.graded += 1
+        self.correct += 1 if correct else 0
+        self.score += ADAPTIVE_RATE * ((1 if correct else 0) - self.score)
+
+    def target(self):
+        """ the difficulty of the range matching the score """
+        low, high = self.difficulties
+        return low + round(self.score * (high - low))
+
+    def dump(self):
+        """ the state of the session as json, see load """
+        return json.dumps({
+            'id': self.id,
+            'category': self.category,
+            'difficulties': self.difficulties,
+            'adaptive': self.adaptive,
+            'seen': sorted(self.seen),
+            'answered': self.answered,
+            'correct': self.correct,
+            'graded': self.graded,
+            'score': self.score,
+            'last': self.last,
+            'process': PROCESS_ID,
+            'cursors': [[category, difficulty, generation, position]
+                        for (category, difficulty), (generation, position)
+                        in self.cursors.items()]
+        })
+
+    @classmethod
+    def load(cls, value: str, expires):
+        """
+        the session of a dump. The cursors are kept in the process that
+        dumped it only, elsewhere the decks are walked from the start again
+        and the seen ids skip what was already asked
+        """
+        data = json.loads(value)
+        difficulties = data['difficulties']
+        session = cls(data['category'], expires,
+                      tuple(difficulties) if difficulties else None,
+                      data['adaptive'])
+        session.id = data['id']
+        session.seen = set(data['seen'])
+        session.answered = data['answered']
+        session.correct = data['correct']
+        session.graded = data['graded']
+        session.score = data['score']
+        session.last = data['last']
+        if (data['process'] == PROCESS_ID):
+            session.cursors = {
+                (category, difficulty): (generation, position)
+                for category, difficulty, generation, position
+                in data['cursors']}
+        return session
+
+    def format(self):
+        low, high = self.difficulties or (None, None)
+        return {
+            'id': self.id,
+            'category': self.category,
+            'answered': self.answered,
+            'correct': self.correct,
+            'score': round(self.score, 3),
+            'adaptive': self.adaptive,
+            'minDifficulty': low,
+            'maxDifficulty': high,
+            'difficulty': self.target() if self.adaptive else None,
+            'expires': max(0, round(self.expires - time.monotonic()))
+        }
+
+
+class MemorySessionStore:
+    """
+    Quiz sessions kept in the memory of the process, so every worker only
+    knows the quizzes it created. At most maxSessions are kept, the least
+    recently used are dropped first.
+    """
+
+    def __init__(self, maxSessions=QUIZ_MAX_SESSIONS):
+        self.maxSessions = maxSessions
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # least recently used first, which is also the expiry order
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _purge(self, now):
+        while (self._sessions):
+            session = next(iter(self._sessions.values()))
+            if (session.expires > now):
+                break
+            self._sessions.popitem(last=False)
+
+    def put(self, session: QuizSession, ttl: int):
+        """ keeps the session for ttl more seconds """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            session.expires = now + ttl
+            if (session.id in self._sessions):
+                self._sessions.move_to_end(session.id)
+                return
+            while (len(self._sessions) >= self.maxSessions):
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            self._sessions[session.id] = session
+
+    def get(self, quizId: str, ttl: int):
+        """ returns the live session and extends its ttl, None otherwise """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(quizId)
+            if (session is not None and session.expires <= now):
+                del self._sessions[quizId]
+                return None
+            if (session is not None):
+                session.expires = now + ttl
+                self._sessions.move_to_end(quizId)
+            return session
+
+    def remove(self, quizId: str):
+        with self._lock:
+            return self._sessions.pop(quizId, None) is not None
+
+
+class RedisSessionStore:
+    """
+    Quiz sessions shared by every worker and host through redis, dumped as
+    json. The keys expire after ttl seconds without a request. The requests
+    of a quiz may reach any worker, two requests of the same quiz at the
+    same time keep the answer of the last one.
+    """
+
+    def __init__(self, client, prefix='trivia:quiz:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str):
+        if (redis is None):
+            raise RuntimeError(f'The redis package is needed for {url}')
+        return cls(redis.Redis.from_url(url))
+
+    def __len__(self):
+        return sum(1 for key in self.client.scan_iter(match=f'{self.prefix}*'))
+
+    def put(self, session: QuizSession, ttl: int):
+        session.expires = time.monotonic() + ttl
+        self.client.set(self.prefix + session.id, session.dump(),
+                        ex=max(1, ttl))
+
+    def get(self, quizId: str, ttl: int):
+        key = self.prefix + quizId
+        value = self.client.get(key)
+        if (value is None):
+            return None
+        self.client.expire(key, max(1, ttl))
+        return QuizSession.load(value, time.monotonic() + ttl)
+
+    def remove(self, quizId: str):
+        return bool(self.client.delete(self.prefix + quizId))
+
+
+class QuizSessions:
+    """
+    The quiz sessions, expired after ttl seconds without a request. They are
+    kept by the store, any object with the methods of MemorySessionStore.
+    The changes of a session are kept once save is called.
+    """
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL, maxSessions=QUIZ_MAX_SESSIONS,
+                 store=None):
+        self.ttl = ttl
+        self.store = store if store is not None \
+            else MemorySessionStore(maxSessions)
+
+    def __len__(self):
+        try:
+            return len(self.store)
+        except Exception as err:
+            print(sys.exc_info(), err)
+            return 0
+
+    @property
+    def evicted(self):
+        return getattr(self.store, 'evicted', 0)
+
+    def create(self, category=None, difficulties=None, adaptive=False):
+        session = QuizSession(category, 0.0, difficulties, adaptive)
+        self.store.put(session, self.ttl)
+        return session
+
+    def get(self, quizId: str):
+        """ returns the live session and extends its ttl, None otherwise """
+        return self.store.get(quizId, self.ttl)
+
+    def save(self, session: QuizSession):
+        self.store.put(session, self.ttl)
+
+    def remove(self, quizId: str):
+        return self.store.remove(quizId)
+
+
+quiz_sessions = QuizSessions()
+
+registry.register(Gauge(
+    'trivia_quiz_sessions', 'Number of live quiz sessions.', (),
+    lambda: [((), len(quiz_sessions))]))
+
+
+"""
+next_question(session, correct)
+    grades the previous question when correct is not None, then deals the
+    next question the session has not seen yet and marks it. Adaptive
+    sessions draw from the deck of the difficulty closest to their score,
+    the others from the decks of their difficulties picked at random in
+    proportion to their size. Returns the row of QUESTION_COLUMNS (None once
+    the questions ran out) and the number of questions left.
+"""
+
+
+def next_question(session: QuizSession, correct=None):
+    decks = question_decks.within(
+        session.category['id'] if session.category is not None else None,
+        session.difficulties)
+
+    with session.lock:
+        if (correct is not None):
+            session.grade(correct)
+
+        if (session.adaptive):
+            # the easier difficulty first when two are as close
+            target = session.target()
+            decks = sorted(decks, key=lambda deck: (
+                abs(deck.key[1] - target), deck.key[1]))
+        else:
+            decks = weighted_order(decks)
+        left = sum(deck.alive for deck in decks) - session.answered
+
+        for deck in decks:
+            questionId = deck.walk(session)
+            while (questionId is not None):
+                row = question_row(questionId)
+                if (row is not None):  # else deleted since it was dealt
+                    session.mark(questionId)
+                    return row, max(0, left - 1)
+                questionId = deck.walk(session)
+        return None, 0
@@ -0,0 +1,188 @@
+import sys
+import math
+import time
+import functools
+import threading
+from collections import OrderedDict
+
+from flask import g, request, abort
+
+try:
+    import redis
+except ImportError:  # only needed for the shared store
+    redis = None
+
+
+# requests allowed per client in a window of seconds, "requests/seconds".
+# The requests refill steadily, a client can spend the whole budget at once
+RATE_LIMITS = {
+    'search': '60/60',
+    'random': '120/60',
+}
+RATE_LIMIT_MAX_CLIENTS = 10000  # buckets kept per process
+API_KEY_HEADER = 'X-API-Key'
+
+# refills and takes a token in one step, so the workers sharing a bucket
+# can't both take its last token. Returns {allowed, tokens left}
+TAKE_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]),
+    tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def parse_budget(value: str):
+    """ returns the (rate per second, burst) of a "requests/seconds" budget """
+    try:
+        requests, seconds = value.split('/')
+        requests, seconds = int(requests), float(seconds)
+    except ValueError:
+        raise ValueError(f'Invalid rate limit {value}')
+    if (requests < 1 or seconds <= 0):
+        raise ValueError(f'Invalid rate limit {value}')
+    return requests / seconds, requests
+
+
+class MemoryStore:
+    """
+    Token buckets kept in the memory of the process, so every worker counts
+    its own requests. Past maxKeys the least recently used buckets are
+    dropped; a dropped bucket starts full again.
+    """
+
+    def __init__(self, maxKeys=RATE_LIMIT_MAX_CLIENTS):
+        self.maxKeys = maxKeys
+        self._lock = threading.Lock()
+        # key -> [tokens, last refill], least recently used first
+        self._buckets = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int, now: float):
+        """ takes a token of the bucket, returns (allowed, tokens left) """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if (bucket is None):
+                bucket = self._buckets[key] = [float(burst), now]
+                while (len(self._buckets) > self.maxKeys):
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                elapsed = max(0.0, now - bucket[1])
+                bucket[0] = min(float(burst), bucket[0] + elapsed * rate)
+                bucket[1] = now
+
+            if (bucket[0] < 1):
+                return False, bucket[0]
+            bucket[0] -= 1
+            return True, bucket[0]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """
+    Token buckets shared by every worker and host through redis. The keys
+    expire once their bucket would be full again.
+    """
+
+    def __init__(self, client, prefix='trivia:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str):
+        if (redis is None):
+            raise RuntimeError(f'The redis package is needed for {url}')
+        return cls(redis.Redis.from_url(url))
+
+    def take(self, key: str, rate: float, burst: int, now: float):
+        allowed, tokens = self._take(keys=[self.prefix + key],
+                                     args=[rate, burst, now])
+        return bool(allowed), float(tokens)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class RateLimiter:
+    """
+    Limits the requests of each client to the routes decorated with
+    rate_limited, with one token bucket per client and budget. Clients are
+    told apart by their API key when it is one of apiKeys, else by their
+    address. Any object with the take method of MemoryStore can be the store.
+    """
+
+    def __init__(self, store=None):
+        self.enabled = False
+        self.store = store if store is not None else MemoryStore()
+        self.budgets = {name: parse_budget(value)
+                        for name, value in RATE_LIMITS.items()}
+        self.apiKeys = frozenset()
+        self.routes = {}  # view name -> budget name
+        self.limited = 0
+
+    def client(self, request):
+        apiKey = request.headers.get(API_KEY_HEADER)
+        if (apiKey is not None and apiKey in self.apiKeys):
+            return f'key:{apiKey}'
+        return f'ip:{request.remote_addr}'
+
+    def check(self, name: str, request):
+        """ returns None if the request may go on, else the seconds to wait """
+        if (not self.enabled):
+            return None
+        budget = self.budgets.get(name)
+        if (budget is None):
+            return None
+
+        rate, burst = budget
+        try:
+            allowed, tokens = self.store.take(
+                f'{name}:{self.client(request)}', rate, burst, time.time())
+        except Exception as err:
+            # a shared store that can't be reached lets the requests through
+            print(sys.exc_info(), err)
+            return None
+        if (allowed):
+            return None
+        self.limited += 1
+        return max(1, math.ceil((1 - tokens) / rate))
+
+
+rate_limiter = RateLimiter()
+
+
+"""
+rate_limited(name)(view)
+    answers 429 Too Many Requests, with a Retry-After header, to the clients
+    that spent their budget of the view
+"""
+
+
+def rate_limited(name: str):
+    def decorator(view):
+        rate_limiter.routes[view.__name__] = name
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            retryAfter = rate_limiter.check(name, request)
+            if (retryAfter is not None):
+                g.retry_after = retryAfter
+                abort(429)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+import sys
+import time
+import math
+import functools
+import threading
+
+from flask import g, request, current_app
+from sqlalchemy import create_engine, text
+from backend.models import db, engine_options
+
+
+REPLICA_LAG_CHECK = 1.0  # seconds between two lag checks
+LAST_WRITE_COOKIE = 'trivia_last_write'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# seconds the replica is behind, 0 when it replayed everything it received
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM
+            now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    """
+    A read only replica of the database with its own engine and scoped
+    session. The replication lag is checked at most every REPLICA_LAG_CHECK
+    seconds.
+    """
+
+    def __init__(self, engine, maxLag: float):
+        self.engine = engine
+        self.maxLag = maxLag
+        self.session = db.create_scoped_session({'bind': engine})
+        self.reads = 0
+        self._lag = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def lag(self):
+        with self._lock:
+            if (time.monotonic() - self._checked < REPLICA_LAG_CHECK):
+                return self._lag
+            self._checked = time.monotonic()
+
+        try:
+            if (self.engine.dialect.name == 'postgresql'):
+                with self.engine.connect() as connection:
+                    lag = float(connection.execute(LAG_QUERY).scalar())
+            else:
+                lag = 0.0
+        except Exception as err:
+            # an unreachable replica is treated as lagging
+            print(sys.exc_info(), err)
+            lag = None
+        self._lag = lag
+        return lag
+
+    def usable(self):
+        lag = self.lag()
+        return lag is not None and lag <= self.maxLag
+
+
+def recent_write(maxLag: float):
+    """ true if this client wrote less than maxLag seconds ago """
+    try:
+        written = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - written < maxLag
+
+
+"""
+read_only(view)
+    routes the queries of a view to the replica, unless it lags more than
+    REPLICA_MAX_LAG seconds or the client wrote recently (read your writes)
+"""
+
+
+def read_only(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        replica = current_app.extensions.get('replica')
+        if (replica is not None and not recent_write(replica.maxLag)
+                and replica.usable()):
+            g.use_replica = True
+            replica.reads += 1
+        return view(*args, **kwargs)
+    return wrapper
+
+
+"""
+setup_replica(app, config)
+    binds the replica of DATABASE_REPLICA_URI (if any) to the app
+"""
+
+
+def setup_replica(app, config):
+    uri = config.get('DATABASE_REPLICA_URI')
+    if (uri):
+        engine = create_engine(
+            uri, **engine_options({**config, 'DATABASE_URI': uri}))
+        app.extensions['replica'] = Replica(engine, config['REPLICA_MAX_LAG'])
+
+    @app.after_request
+    def remember_write(response):
+        # marks the clients that wrote so they read from the primary until
+        # the replica caught up
+        replica = app.extensions.get('replica')
+        if (replica is not None and request.method in WRITE_METHODS
+                and not g.get('read_only') and response.status_code < 400):
+            response.set_cookie(LAST_WRITE_COOKIE, str(time.time()),
+                                max_age=math.ceil(replica.maxLag))
+        return response
+
+    @app.teardown_appcontext
+    def remove_replica_session(exception=None):
+        replica = app.extensions.get('replica')
+        if (replica is not None):
+            replica.session.remove()
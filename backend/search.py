@@ -0,0 +1,216 @@
+import time
+import threading
+
+from sqlalchemy import func, text
+from backend.models import db, Question, TableVersion, on_change, \
+    committed_version, select_questions
+
+
+SEARCH_RESULTS_LIMIT = 100
+TRIGRAM_SIZE = 3
+SEARCH_VERSION_CHECK = 1.0  # seconds between two checks of the index version
+
+# the pg_trgm migration is optional, similarity() only exists once it ran
+TRIGRAM_EXTENSION_QUERY = \
+    "SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"
+
+
+def trigrams(value: str):
+    return {value[idx:idx + TRIGRAM_SIZE]
+            for idx in range(len(value) - TRIGRAM_SIZE + 1)}
+
+
+def escape_like(value: str):
+    return value \
+        .replace('\\', '\\\\') \
+        .replace('%', '\\%') \
+        .replace('_', '\\_')
+
+
+class TrigramIndex:
+    """
+    Pure python inverted index mapping every trigram of the question text to
+    the ids of the questions containing it. Used when the database has no
+    trigram index (e.g.: SQLite test runs). Matches are substrings, the same
+    as an ILIKE '%term%' query. The difficulty of each question is kept to
+    filter the matches on it.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._texts = {}
+        self._difficulties = {}
+
+    def build(self, rows):
+        """ indexes the (id, question, difficulty) rows """
+        with self._lock:
+            self._postings = {}
+            self._texts = {}
+            self._difficulties = {}
+            for questionId, question, difficulty in rows:
+                self._add(questionId, question, difficulty)
+            self.ready = True
+
+    def _add(self, questionId: int, question: str, difficulty: int):
+        value = (question or '').lower()
+        self._texts[questionId] = value
+        self._difficulties[questionId] = difficulty
+        for trigram in trigrams(value):
+            self._postings.setdefault(trigram, set()).add(questionId)
+
+    def _remove(self, questionId: int):
+        value = self._texts.pop(questionId, None)
+        self._difficulties.pop(questionId, None)
+        if (value is None):
+            return
+        for trigram in trigrams(value):
+            postings = self._postings.get(trigram)
+            if (postings is not None):
+                postings.discard(questionId)
+                if (not postings):
+                    del self._postings[trigram]
+
+    def add(self, questionId: int, question: str, difficulty: int):
+        with self._lock:
+            self._remove(questionId)
+            self._add(questionId, question, difficulty)
+
+    def remove(self, questionId: int):
+        with self._lock:
+            self._remove(questionId)
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+            self._postings = {}
+            self._texts = {}
+            self._difficulties = {}
+
+    def search(self, term: str, limit: int, difficulties=None):
+        """
+        returns the ids of the questions containing term, best first, within
+        the (min, max) difficulties if any
+        """
+        needle = term.lower()
+        with self._lock:
+            grams = trigrams(needle)
+            if (grams):
+                # intersects the posting lists starting from the shortest
+                postings = sorted((self._postings.get(gram, set())
+                                   for gram in grams), key=len)
+                candidates = set.intersection(*postings)
+            else:  # the term is too short to have trigrams
+                candidates = self._texts.keys()
+            if (difficulties is not None):
+                low, high = difficulties
+                candidates = [questionId for questionId in candidates
+                              if self._difficulties[questionId] is not None
+                              and low <= self._difficulties[questionId] <= high]
+
+            matches = [(len(needle) / len(self._texts[questionId]), questionId)
+                       for questionId in candidates
+                       if needle in self._texts[questionId]]
+
+        # the closer the term is to the whole question the better the match
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [questionId for rank, questionId in matches[:limit]]
+
+
+class QuestionSearch:
+    """
+    Searches the question text with an ILIKE on postgreSQL, served by the
+    trigram index and ranked by similarity when pg_trgm is installed (else
+    ordered by id), and with the in-process TrigramIndex otherwise. Like the
+    decks, the version of the questions is read at most every
+    SEARCH_VERSION_CHECK seconds and the index is built again once another
+    process changed the questions.
+    """
+
+    def __init__(self):
+        self.index = TrigramIndex()
+        self.trigrams = None  # pg_trgm installed, checked once
+        self._lock = threading.Lock()
+        self._version = None  # of the questions table, None if unknown
+        self._checked = 0.0
+
+    def check(self):
+        """ drops the index if the questions changed in another process """
+        with self._lock:
+            if (time.monotonic() - self._checked < SEARCH_VERSION_CHECK):
+                return
+            self._checked = time.monotonic()
+        # read before the index is built, it is at least as recent
+        version = db.session.query(TableVersion.version) \
+            .filter(TableVersion.name == Question.__tablename__) \
+            .scalar() or 0
+        with self._lock:
+            if (version != self._version):
+                self.index.invalidate()
+                self._version = version
+
+    def advance(self, versions):
+        """ same as QuestionStore.advance """
+        with self._lock:
+            if (versions is None or self._version not in versions):
+                self._version = None
+            else:
+                self._version = versions[1]
+
+    def has_trigrams(self):
+        if (self.trigrams is None):
+            self.trigrams = bool(db.session.execute(
+                text(TRIGRAM_EXTENSION_QUERY)).scalar())
+        return self.trigrams
+
+    def search(self, term: str, limit=SEARCH_RESULTS_LIMIT,
+               difficulties=None):
+        """
+        returns up to limit rows of QUESTION_COLUMNS containing term (within
+        the (min, max) difficulties if any), best match first, as a query on
+        postgreSQL (so it can be streamed) or as a list
+        """
+        if (db.engine.dialect.name == 'postgresql'):
+            # the ILIKE is served by the gin_trgm_ops index
+            query = select_questions() \
+                .filter(Question.question.ilike(
+                    f'%{escape_like(term)}%', escape='\\'))
+            if (difficulties is not None):
+                query = query.filter(Question.difficulty.between(*difficulties))
+            if (self.has_trigrams()):
+                query = query.order_by(
+                    func.similarity(Question.question, term).desc())
+            return query.order_by(Question.id.asc()).limit(limit)
+
+        self.check()
+        if (not self.index.ready):
+            self.index.build(db.session.query(
+                Question.id, Question.question, Question.difficulty).all())
+
+        ids = self.index.search(term, limit, difficulties)
+        if (not ids):
+            return []
+        records = {record.id: record for record in
+                   select_questions().filter(Question.id.in_(ids)).all()}
+        return [records[questionId] for questionId in ids
+                if questionId in records]
+
+
+question_search = QuestionSearch()
+
+
+@on_change
+def update_search_index(table, operation, records):
+    if (table != Question.__tablename__ or not question_search.index.ready):
+        return
+    if (operation == 'reset'):
+        question_search.index.invalidate()
+        return
+    for record in records:
+        if (operation == 'delete'):
+            question_search.index.remove(record['id'])
+        else:
+            question_search.index.add(
+                record['id'], record['question'], record['difficulty'])
+    question_search.advance(committed_version(table))
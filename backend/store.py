@@ -0,0 +1,313 @@
+import time
+import heapq
+import bisect
+import threading
+from array import array
+from itertools import islice
+from collections import namedtuple
+
+from flask import abort
+from flask_sqlalchemy import Pagination
+from backend.models import db, Question, TableVersion, QUESTION_COLUMNS, \
+    on_change, committed_version, select_questions
+from backend.search import question_search
+from backend.conditional import request_version
+
+
+QUESTION_STORE_TTL = 300  # seconds
+
+# attribute access like the rows of QUESTION_COLUMNS
+QuestionRow = namedtuple(
+    'QuestionRow', ['id', 'question', 'answer', 'category', 'difficulty'])
+
+
+def index_id(index: dict, key, questionId: int):
+    ids = index.setdefault(key, array('q'))
+    ids.insert(bisect.bisect_left(ids, questionId), questionId)
+
+
+def unindex_id(index: dict, key, questionId: int):
+    ids = index.get(key)
+    if (ids is None):
+        return
+    position = bisect.bisect_left(ids, questionId)
+    if (position < len(ids) and ids[position] == questionId):
+        del ids[position]
+    if (not ids):
+        del index[key]
+
+
+class QuestionStore:
+    """
+    Optional copy of every question held in memory column by column (ids
+    sorted in an array, one list per other column) with the sorted ids of
+    each category and of each (category, difficulty) in their own arrays.
+    Serves the question reads without hitting the database. It is kept up
+    to date by the change notifications of this process and reloaded once
+    the ttl expires or when a request read a newer version of the questions
+    table (the changes of other processes). One request reloads it at a
+    time; the others keep reading the expired copy meanwhile, unless it is
+    older than the version they read.
+    """
+
+    def __init__(self, ttl=QUESTION_STORE_TTL):
+        self.enabled = False
+        self.ttl = ttl
+        self.loads = 0
+        self._lock = threading.RLock()
+        self._loading = threading.Lock()
+        self._loaded = False
+        self._expires = 0.0
+        self._version = None  # of the questions table, None if unknown
+        self._clear()
+
+    def _clear(self):
+        self.ids = array('q')
+        self.questions = []
+        self.answers = []
+        self.categories = []
+        self.difficulties = []
+        self.byCategory = {}
+        self.byDifficulty = {}  # (category, difficulty) -> ids
+
+    def load(self):
+        """ reads every question from the primary database """
+        # read first, the rows are at least as recent as this version
+        version = db.session.query(TableVersion.version) \
+            .filter(TableVersion.name == Question.__tablename__) \
+            .scalar()
+        rows = db.session.query(*QUESTION_COLUMNS) \
+            .order_by(Question.id.asc()) \
+            .all()
+        ids = array('q')
+        questions, answers, categories, difficulties = [], [], [], []
+        byCategory, byDifficulty = {}, {}
+        for questionId, question, answer, category, difficulty in rows:
+            ids.append(questionId)
+            questions.append(question)
+            answers.append(answer)
+            categories.append(category)
+            difficulties.append(difficulty)
+            byCategory.setdefault(category, array('q')).append(questionId)
+            byDifficulty.setdefault((category, difficulty), array('q')) \
+                .append(questionId)
+
+        with self._lock:
+            self.ids, self.questions, self.answers = ids, questions, answers
+            self.categories, self.difficulties = categories, difficulties
+            self.byCategory, self.byDifficulty = byCategory, byDifficulty
+            self._loaded = True
+            self._expires = time.monotonic() + self.ttl
+            self._version = version or 0
+            self.loads += 1
+            # built from the previous copy, search rebuilds it from this one
+            question_search.index.invalidate()
+
+    def _current(self, version):
+        """ true if loaded and not older than version (None if unknown) """
+        return self._loaded and (version is None or (
+            self._version is not None and version <= self._version))
+
+    def active(self):
+        """ true if enabled, loads the questions when they are stale """
+        if (not self.enabled):
+            return False
+        version = request_version(Question.__tablename__)
+        with self._lock:
+            if (self._current(version) and time.monotonic() < self._expires):
+                return True
+            wait = not self._current(version)
+
+        if (not self._loading.acquire(blocking=wait)):
+            return True  # another request reloads the expired copy
+        try:
+            with self._lock:
+                stale = not self._current(version) \
+                    or time.monotonic() >= self._expires
+            if (stale):
+                self.load()
+        finally:
+            self._loading.release()
+        return True
+
+    def advance(self, versions):
+        """
+        moves to the (before, after) versions of a commit of this process
+        whose changes were applied, forgets the version if they don't follow
+        """
+        with self._lock:
+            if (versions is None or self._version not in versions):
+                self._version = None
+            else:
+                self._version = versions[1]
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+            self._version = None
+            self._clear()
+
+    def _find(self, questionId):
+        position = bisect.bisect_left(self.ids, questionId)
+        if (position < len(self.ids) and self.ids[position] == questionId):
+            return position
+        return None
+
+    def _row(self, position):
+        return QuestionRow(self.ids[position], self.questions[position],
+                           self.answers[position], self.categories[position],
+                           self.difficulties[position])
+
+    def get(self, questionId: int):
+        with self._lock:
+            position = self._find(questionId)
+            return self._row(position) if position is not None else None
+
+    def _groups(self, categoryId, difficulties):
+        """ the sorted arrays of ids of the category within the difficulties """
+        if (difficulties is None):
+            if (categoryId is None):
+                return [self.ids]
+            ids = self.byCategory.get(categoryId)
+            return [ids] if ids is not None else []
+        low, high = difficulties
+        return [ids for (category, difficulty), ids
+                in self.byDifficulty.items()
+                if (categoryId is None or category == categoryId)
+                and difficulty is not None and low <= difficulty <= high]
+
+    def count(self, categoryId=None, difficulties=None):
+        with self._lock:
+            return sum(len(ids) for ids
+                       in self._groups(categoryId, difficulties))
+
+    def counts(self, difficulties=None):
+        """ same as models.count_by_category """
+        with self._lock:
+            if (difficulties is None):
+                return {categoryId: len(ids)
+                        for categoryId, ids in self.byCategory.items()}
+            low, high = difficulties
+            counts = {}
+            for (categoryId, difficulty), ids in self.byDifficulty.items():
+                if (difficulty is not None and low <= difficulty <= high):
+                    counts[categoryId] = counts.get(categoryId, 0) + len(ids)
+            return counts
+
+    def rows(self, categoryId=None, afterId=None, offset=0, limit=None,
+             difficulties=None):
+        """
+        returns the rows ordered by id, optionally after afterId and within
+        the (min, max) difficulties
+        """
+        with self._lock:
+            groups = self._groups(categoryId, difficulties)
+            starts = [offset if afterId is None
+                      else offset + bisect.bisect_right(ids, afterId)
+                      for ids in groups]
+            if (len(groups) == 1 and groups[0] is self.ids):
+                end = len(self.ids) if limit is None \
+                    else min(starts[0] + limit, len(self.ids))
+                return [self._row(position)
+                        for position in range(starts[0], end)]
+            if (len(groups) == 1):
+                end = None if limit is None else starts[0] + limit
+                selected = groups[0][starts[0]:end]
+            else:
+                # merges the groups lazily, up to the last row of the page
+                merged = heapq.merge(*(
+                    islice(ids, start - offset, None)
+                    for ids, start in zip(groups, starts)))
+                selected = islice(merged, offset,
+                                  None if limit is None else offset + limit)
+            return [self._row(self._find(questionId))
+                    for questionId in selected]
+
+    def paginate(self, categoryId, page: int, perPage: int,
+                 difficulties=None):
+        """ same pages and errors as flask_sqlalchemy's paginate """
+        if (page < 1 or perPage < 0):
+            abort(404)
+        items = self.rows(categoryId, offset=(page - 1) * perPage,
+                          limit=perPage, difficulties=difficulties)
+        if (not items and page != 1):
+            abort(404)
+        return Pagination(None, page, perPage,
+                          self.count(categoryId, difficulties), items)
+
+    def search(self, term: str, limit: int, difficulties=None):
+        """ same matches as the in process search index """
+        index = question_search.index
+        with self._lock:
+            if (not index.ready):
+                index.build(zip(self.ids, self.questions, self.difficulties))
+        return [row for row in (self.get(questionId) for questionId
+                                in index.search(term, limit, difficulties))
+                if row is not None]
+
+    def put(self, record):
+        """ adds or replaces the question of a formatted record """
+        with self._lock:
+            questionId = record['id']
+            position = self._find(questionId)
+            if (position is None):
+                position = bisect.bisect_left(self.ids, questionId)
+                self.ids.insert(position, questionId)
+                self.questions.insert(position, None)
+                self.answers.insert(position, None)
+                self.categories.insert(position, None)
+                self.difficulties.insert(position, None)
+            else:
+                self._unindex(position)
+
+            self.questions[position] = record['question']
+            self.answers[position] = record['answer']
+            self.categories[position] = record['category']
+            self.difficulties[position] = record['difficulty']
+            index_id(self.byCategory, record['category'], questionId)
+            index_id(self.byDifficulty,
+                     (record['category'], record['difficulty']), questionId)
+
+    def remove(self, questionId: int):
+        with self._lock:
+            position = self._find(questionId)
+            if (position is None):
+                return
+            self._unindex(position)
+            del self.ids[position]
+            del self.questions[position]
+            del self.answers[position]
+            del self.categories[position]
+            del self.difficulties[position]
+
+    def _unindex(self, position):
+        questionId = self.ids[position]
+        category = self.categories[position]
+        unindex_id(self.byCategory, category, questionId)
+        unindex_id(self.byDifficulty,
+                   (category, self.difficulties[position]), questionId)
+
+
+question_store = QuestionStore()
+
+
+def question_row(questionId: int):
+    """ returns the row of QUESTION_COLUMNS of a question or None """
+    if (question_store.active()):
+        return question_store.get(questionId)
+    return select_questions().filter(Question.id == questionId).first()
+
+
+@on_change
+def update_question_store(table, operation, records):
+    if (table != Question.__tablename__ or not question_store.enabled):
+        return
+    if (operation == 'reset'):
+        question_store.invalidate()
+        return
+    for record in records:
+        if (operation == 'delete'):
+            question_store.remove(record['id'])
+        else:
+            question_store.put(record)
+    question_store.advance(committed_version(table))
@@ -0,0 +1,65 @@
+import json
+
+from flask import Response, stream_with_context, current_app, jsonify
+from backend.serializer import pretty_print
+
+
+STREAM_BATCH_SIZE = 500
+
+
+def dumps(value, pretty=False):
+    # same encoding jsonify uses: sorted keys and no whitespace, or indented
+    # in debug mode (see serializer.pretty_print)
+    if (pretty):
+        return json.dumps(value, sort_keys=True, indent=2,
+                          separators=(', ', ': '))
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def stream_json(envelope: dict, key: str, records, formatter,
+                batchSize=STREAM_BATCH_SIZE):
+    """
+    Returns a streaming response with the json of envelope where key holds
+    the array of the records passed through formatter. Queries are read
+    through a server side cursor so only batchSize rows are held in memory at
+    a time.
+    Callable values of envelope are called with the number of records streamed
+    as long as they sort after key (e.g.: 'found' after 'data'). An error
+    while reading the records ends the body before the array is closed.
+    In debug mode the response is buffered and indented like jsonify's.
+    """
+    if (pretty_print()):
+        data = [formatter(record) for record in records]
+        return jsonify({
+            **{name: value(len(data)) if callable(value) else value
+               for name, value in envelope.items()},
+            key: data})
+
+    if (hasattr(records, 'yield_per')):
+        records = records.yield_per(batchSize)
+
+    def generate():
+        count = 0
+        yield '{'
+        for position, name in enumerate(sorted(list(envelope) + [key])):
+            yield (',' if position else '') + dumps(name) + ':'
+            if (name != key):
+                value = envelope[name]
+                yield dumps(value(count) if callable(value) else value)
+                continue
+
+            yield '['
+            try:
+                for record in records:
+                    yield (',' if count else '') + dumps(formatter(record))
+                    count += 1
+            except Exception:
+                # the status is already sent, the document is left unclosed
+                # so the client can't take the records sent for all of them
+                current_app.logger.exception('Stream of %s cut short', key)
+                return
+            yield ']'
+        yield '}\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
@@ -22,7 +22,7 @@ class QuestionView extends Component {
 
   getQuestions = () => {
     $.ajax({
-      url: `/api/v1.0/questions?page=${this.state.page}`, 
+      url: `/api/v1.0/dashboard?page=${this.state.page}`, 
       // [ ] TODO: update request URL
       type: 'GET',
       success: (result) => {